@@ -0,0 +1,284 @@
+# Level analytics
+#
+# Solves many boards per level on a process pool and reports what tuning
+# the difficulty curve needs: solve rate, solution length distribution,
+# branching factor, dead ends and generation time. Boards come from one of
+#   deal      random deals with the level's colours, tubes and capacity,
+#             i.e. what the generator starts from before scoring
+#   generate  full generate_level runs, timing the whole generation
+#   pack      the levels of a level pack
+# One row per board is streamed to CSV or JSON Lines as results arrive and
+# only per-level counters are kept, so runs of any size fit in memory. Jobs
+# are chunks of boards, whose starting positions are measured in one go
+# with BatchBoard when NumPy is installed. No pygame is imported; this runs
+# on headless machines.
+#
+#   python analytics.py --last 50 --boards 200 --out stats.csv
+#   python analytics.py --source pack --pack levels.pack --out stats.jsonl
+
+import argparse
+import collections
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import generator
+import solver
+from batchboard import HAVE_NUMPY, BatchBoard
+from levelpack import open_pack
+from rules import Puzzle
+
+SOURCES = ["deal", "generate", "pack"]
+FIELDS = ["level", "index", "seed", "source", "colors", "tubes", "capacity", "solved",
+          "exhausted", "moves", "branching_factor", "dead_end_ratio", "expanded",
+          "start_moves", "start_heuristic", "generate_ms", "solve_ms", "attempts", "score"]
+PENDING_PER_WORKER = 4  # jobs in flight per worker, bounds memory on long runs
+CHUNK_SIZE = 16  # boards per job
+
+
+def start_features(boards):
+    # (legal pours, heuristic) for each starting board, boards being
+    # (tubes, capacity) pairs: one BatchBoard per capacity with NumPy,
+    # otherwise board by board
+    features = [None] * len(boards)
+    if HAVE_NUMPY:
+        by_capacity = {}
+        for i, (tubes, capacity) in enumerate(boards):
+            by_capacity.setdefault(capacity, []).append(i)
+        for capacity, indices in by_capacity.items():
+            stats = BatchBoard.from_tubes([boards[i][0] for i in indices], capacity).features()
+            for k, i in enumerate(indices):
+                features[i] = (int(stats["legal_moves"][k]), int(stats["heuristic"][k]))
+        return features
+    for i, (tubes, capacity) in enumerate(boards):
+        state = tuple(tuple(colors) for colors in tubes)
+        features[i] = (len(Puzzle(tubes, capacity).legal_moves()), solver.heuristic(state))
+    return features
+
+
+def _solve_stats(tubes, capacity, weight, node_limit):
+    result = solver.solve(tubes, capacity, weight, node_limit=node_limit)
+    return {
+        "colors": len(set(color for colors in tubes for color in colors)),
+        "tubes": len(tubes),
+        "capacity": capacity,
+        "solved": result.solved,
+        "exhausted": result.exhausted,
+        "moves": len(result.moves) if result.solved else None,
+        "branching_factor": round(result.branching_factor, 3),
+        "dead_end_ratio": round(result.dead_end_ratio, 4),
+        "expanded": result.expanded,
+        "solve_ms": round(result.elapsed * 1000.0, 2),
+    }
+
+
+def _make_board(source, mode, node_limit, level, seed, board, row):
+    start = time.perf_counter()
+    if source == "deal":
+        num_colors, num_tubes, capacity = mode.level_params(level)
+        tubes = generator.deal(random.Random(seed), num_colors, num_tubes, capacity,
+                               mode.palette_size)
+    elif source == "generate":
+        generated = generator.generate_level(level, seed, node_limit=node_limit, mode=mode)
+        tubes, capacity = generated.tubes, generated.capacity
+        row["attempts"] = generated.attempts
+        row["score"] = round(generated.score, 3)
+    else:
+        return board
+    row["generate_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+    return tubes, capacity
+
+
+def _run_job(job):
+    # One chunk of boards; returns their rows in order
+    source, mode_name, node_limit, items = job
+    mode = generator.MODES[mode_name]
+    rows = []
+    boards = []
+    for level, index, seed, board in items:
+        row = {"level": level, "index": index, "seed": seed, "source": source,
+               "generate_ms": None, "attempts": None, "score": None}
+        boards.append(_make_board(source, mode, node_limit, level, seed, board, row))
+        rows.append(row)
+    for row, (tubes, capacity), (moves, estimate) in zip(rows, boards, start_features(boards)):
+        row["start_moves"] = moves
+        row["start_heuristic"] = estimate
+        row.update(_solve_stats(tubes, capacity, mode.weight, node_limit))
+    return rows
+
+
+def _pack_items(pack, first, last):
+    for level in range(first, last + 1):
+        entry = pack.level(level)
+        yield (level, 0, entry.seed, (entry.tubes, entry.capacity))
+
+
+def make_jobs(args, pack=None):
+    # Lazily, so a long run never holds every job at once
+    if args.source == "pack":
+        mode = pack.mode
+        items = _pack_items(pack, args.first, min(args.last, len(pack)))
+    else:
+        mode = args.mode
+        items = ((level, index, generator.level_seed(level, index, args.seed), None)
+                 for level in range(args.first, args.last + 1)
+                 for index in range(args.boards))
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == CHUNK_SIZE:
+            yield (args.source, mode, args.node_limit, chunk)
+            chunk = []
+    if chunk:
+        yield (args.source, mode, args.node_limit, chunk)
+
+
+def run_jobs(jobs, workers=None):
+    # Rows in job order, with at most a few jobs per worker submitted ahead
+    # instead of all of them like Executor.map
+    if workers == 1:
+        for job in jobs:
+            for row in _run_job(job):
+                yield row
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        limit = (workers or os.cpu_count() or 1) * PENDING_PER_WORKER
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.submit(_run_job, job))
+            if len(pending) >= limit:
+                for row in pending.popleft().result():
+                    yield row
+        while pending:
+            for row in pending.popleft().result():
+                yield row
+
+
+class LevelSummary:
+    def __init__(self, level):
+        self.level = level
+        self.boards = 0
+        self.solved = 0
+        self.exhausted = 0
+        self.moves = collections.Counter()
+        self.branching = 0.0
+        self.dead_ends = 0.0
+        self.generate_ms = 0.0
+        self.solve_ms = 0.0
+
+    def add(self, row):
+        self.boards += 1
+        self.solved += row["solved"]
+        self.exhausted += row["exhausted"]
+        if row["solved"]:
+            self.moves[row["moves"]] += 1
+        self.branching += row["branching_factor"]
+        self.dead_ends += row["dead_end_ratio"]
+        self.generate_ms += row["generate_ms"] or 0.0
+        self.solve_ms += row["solve_ms"]
+
+    def move_percentile(self, fraction):
+        if not self.solved:
+            return None
+        rank = fraction * (self.solved - 1)
+        seen = 0
+        for moves in sorted(self.moves):
+            seen += self.moves[moves]
+            if seen > rank:
+                return moves
+        return max(self.moves)
+
+    def table_row(self):
+        def moves(fraction):
+            value = self.move_percentile(fraction)
+            return "-" if value is None else str(value)
+        return "%5d %6d %7.1f%% %5s %5s %5s %5s %7.2f %7.3f %10.1f %10.1f" % (
+            self.level, self.boards, 100.0 * self.solved / self.boards, moves(0.0), moves(0.5),
+            moves(0.9), moves(1.0), self.branching / self.boards, self.dead_ends / self.boards,
+            self.generate_ms / self.boards, self.solve_ms / self.boards)
+
+
+TABLE_HEADER = "%5s %6s %8s %5s %5s %5s %5s %7s %7s %10s %10s" % (
+    "level", "boards", "solved", "min", "p50", "p90", "max", "branch", "dead", "gen ms",
+    "solve ms")
+
+
+class RowWriter:
+    def __init__(self, out, fmt):
+        self.out = out
+        self.csv = csv.DictWriter(out, FIELDS) if fmt == "csv" else None
+        if self.csv:
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.csv.writerow(row)
+        else:
+            self.out.write(json.dumps(row) + "\n")
+
+
+def output_format(args):
+    if args.format:
+        return args.format
+    return "csv" if args.out.lower().endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-level solver statistics for water sort")
+    parser.add_argument("--source", choices=SOURCES, default="deal", help="where boards come from")
+    parser.add_argument("--first", type=int, default=1, help="first level")
+    parser.add_argument("--last", type=int, default=50, help="last level")
+    parser.add_argument("--boards", type=int, default=100, help="boards per level (deal, generate)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed (deal, generate)")
+    parser.add_argument("--mode", choices=sorted(generator.MODES), default="classic",
+                        help="game mode (deal, generate)")
+    parser.add_argument("--pack", help="level pack to analyse (pack)")
+    parser.add_argument("--node-limit", type=int, default=generator.NODE_LIMIT,
+                        help="solver expansions per board before giving up")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--out", default="-", help="per-board rows, '-' for stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="row format, by default from the --out extension (jsonl otherwise)")
+    args = parser.parse_args(argv)
+
+    pack = None
+    if args.source == "pack":
+        if not args.pack:
+            parser.error("--source pack needs --pack")
+        pack = open_pack(args.pack)
+        if pack is None:
+            parser.error("cannot open level pack %s" % args.pack)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    # With rows on stdout the summary goes to stderr so the rows stay parseable
+    report = sys.stderr if out is sys.stdout else sys.stdout
+    writer = RowWriter(out, output_format(args))
+    summaries = collections.OrderedDict()
+    start = time.perf_counter()
+    try:
+        for row in run_jobs(make_jobs(args, pack), args.workers):
+            writer.write(row)
+            summary = summaries.get(row["level"])
+            if summary is None:
+                summary = summaries[row["level"]] = LevelSummary(row["level"])
+            summary.add(row)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if pack is not None:
+            pack.close()
+
+    elapsed = time.perf_counter() - start
+    boards = sum(summary.boards for summary in summaries.values())
+    report.write(TABLE_HEADER + "\n")
+    for summary in summaries.values():
+        report.write(summary.table_row() + "\n")
+    report.write("%d boards in %.1fs (%.1f/s)\n" % (boards, elapsed, boards / elapsed if elapsed else 0.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Batched boards on NumPy
+#
+# Many boards as one int8 array of shape (boards, tubes, capacity), colour
+# indices bottom first and EMPTY above the liquid, plus an int8 array of
+# fill heights. Legal moves, win state and the solver's heuristic features
+# are then computed for every board at once with array ops instead of a
+# Python loop per tube, which is what bulk generation and analysis need.
+#
+# NumPy is optional: the game never imports this module, and tools check
+# HAVE_NUMPY before using it.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAVE_NUMPY = np is not None
+EMPTY = -1
+
+
+class BatchBoard:
+    def __init__(self, cells, heights, capacity, valid=None):
+        if np is None:
+            raise RuntimeError("BatchBoard needs NumPy")
+        self.cells = cells      # (boards, tubes, capacity) int8
+        self.heights = heights  # (boards, tubes) int8
+        self.capacity = capacity
+        # Boards with fewer tubes than the widest are padded with tubes
+        # that are never a source or destination
+        self.valid = valid if valid is not None else np.ones(heights.shape, dtype=bool)
+
+    @classmethod
+    def from_tubes(cls, boards, capacity):
+        # boards is a list of boards, each a list of colour index lists
+        num_tubes = max(len(tubes) for tubes in boards)
+        cells = np.full((len(boards), num_tubes, capacity), EMPTY, dtype=np.int8)
+        heights = np.zeros((len(boards), num_tubes), dtype=np.int8)
+        valid = np.zeros((len(boards), num_tubes), dtype=bool)
+        for b, tubes in enumerate(boards):
+            valid[b, :len(tubes)] = True
+            for t, colors in enumerate(tubes):
+                if len(colors) > capacity:
+                    raise ValueError("board %d tube %d holds more than %d colours" % (b, t, capacity))
+                cells[b, t, :len(colors)] = colors
+                heights[b, t] = len(colors)
+        return cls(cells, heights, capacity, valid)
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    def tubes(self, index):
+        # One board back as colour index lists
+        return [self.cells[index, t, :self.heights[index, t]].tolist()
+                for t in range(self.cells.shape[1]) if self.valid[index, t]]
+
+    def copy(self):
+        return BatchBoard(self.cells.copy(), self.heights.copy(), self.capacity, self.valid.copy())
+
+    def filled(self):
+        # (boards, tubes, capacity) mask of slots holding liquid
+        return np.arange(self.capacity) < self.heights[..., None]
+
+    def tops(self):
+        below = np.maximum(self.heights.astype(np.intp) - 1, 0)
+        tops = np.take_along_axis(self.cells, below[..., None], axis=2)[..., 0]
+        return np.where(self.heights > 0, tops, EMPTY)
+
+    def run_changes(self):
+        # Colour changes inside each tube, i.e. runs - 1 for non-empty tubes
+        changed = self.cells[..., 1:] != self.cells[..., :-1]
+        return (changed & self.filled()[..., 1:]).sum(axis=2)
+
+    def top_runs(self):
+        # Length of the run of the top colour in each tube
+        tops = self.tops()
+        breaks = (self.cells != tops[..., None]) & self.filled()
+        last_break = np.where(breaks, np.arange(self.capacity), -1).max(axis=2)
+        return np.where(self.heights > 0, self.heights - 1 - last_break, 0)
+
+    def completed(self):
+        return (self.heights == self.capacity) & (self.run_changes() == 0) & self.valid
+
+    def is_solved(self):
+        done = (self.heights == 0) | self.completed() | ~self.valid
+        return done.all(axis=1)
+
+    def legal_moves(self):
+        # (boards, src, dst) mask of pours that move at least one segment,
+        # skipping finished tubes as sources like Puzzle.legal_moves
+        tops = self.tops()
+        source = self.valid & (self.heights > 0) & ~self.completed()
+        target = self.valid & (self.heights < self.capacity)
+        matches = (tops[:, :, None] == tops[:, None, :]) | (self.heights[:, None, :] == 0)
+        legal = source[:, :, None] & target[:, None, :] & matches
+        num_tubes = self.heights.shape[1]
+        legal[:, np.arange(num_tubes), np.arange(num_tubes)] = False
+        return legal
+
+    def duplicate_bottoms(self):
+        # Tubes whose bottom colour already sits at the bottom of another
+        bottoms = np.where((self.heights > 0) & self.valid, self.cells[..., 0], EMPTY)
+        bottoms.sort(axis=1)
+        return ((bottoms[:, 1:] == bottoms[:, :-1]) & (bottoms[:, 1:] != EMPTY)).sum(axis=1)
+
+    def heuristic(self):
+        # Same admissible estimate as solver.heuristic, per board
+        return self.run_changes().sum(axis=1) + self.duplicate_bottoms()
+
+    def features(self):
+        # Per-board arrays for analysis and scoring
+        legal = self.legal_moves().sum(axis=(1, 2))
+        solved = self.is_solved()
+        return {
+            "runs": (self.run_changes() + (self.heights > 0)).sum(axis=1),
+            "completed": self.completed().sum(axis=1),
+            "empty": ((self.heights == 0) & self.valid).sum(axis=1),
+            "duplicate_bottoms": self.duplicate_bottoms(),
+            "heuristic": self.heuristic(),
+            "legal_moves": legal,
+            "solved": solved,
+            "dead_end": (legal == 0) & ~solved,
+        }
+
+    def pour(self, src, dst):
+        # One pour per board, src and dst being (boards,) tube indices, in
+        # place; returns the segments moved on each board, 0 where illegal
+        boards = np.arange(len(self))
+        src = np.asarray(src)
+        dst = np.asarray(dst)
+        legal = self.legal_moves()[boards, src, dst]
+        room = self.capacity - self.heights[boards, dst]
+        amount = np.where(legal, np.minimum(self.top_runs()[boards, src], room), 0)
+        for k in range(self.capacity):
+            active = amount > k
+            if not active.any():
+                break
+            b, s, d = boards[active], src[active], dst[active]
+            below = self.heights[b, s] - 1
+            self.cells[b, d, self.heights[b, d]] = self.cells[b, s, below]
+            self.cells[b, s, below] = EMPTY
+            self.heights[b, s] -= 1
+            self.heights[b, d] += 1
+        return amount
@@ -0,0 +1,67 @@
+# Memory retained across steady-state frames, per screen
+#
+#   python benchmarks/alloc_frames.py [frames]
+#
+# Each screen is entered once and warmed up, then tracemalloc compares the
+# heap before and after N frames of hover sweeps and draws. With layouts
+# built per transition and cached text/sprites, the growth should be ~0.
+
+import sys
+import time
+import tracemalloc
+
+from common import load_game
+
+
+def run_frames(game, surface, frames, positions):
+    for i in range(frames):
+        game.update_hover(positions[i % len(positions)])
+        game.draw(surface)
+
+
+def start_level(game, level):
+    # Levels without a pack are generated in the background
+    game.start_level(level)
+    while game.loader is not None:
+        time.sleep(0.01)
+        game.update(0)
+
+
+def snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    frames = int(args[0]) if args else 600
+
+    ws = load_game()
+    game = ws.Game()
+    screens = [
+        ("menu", game.show_menu),
+        ("level_select", game.show_level_select),
+        ("playing", lambda: start_level(game, 1)),
+    ]
+    # Sweep across the button rows so hover states keep changing
+    positions = [(x, y) for y in (180, 300) for x in range(0, ws.SCREEN_WIDTH, 40)]
+
+    print("%-14s %8s %12s %10s" % ("screen", "frames", "net bytes", "blocks"))
+    for name, enter in screens:
+        enter()
+        run_frames(game, ws.screen, 60, positions)
+
+        tracemalloc.start()
+        before = snapshot()
+        run_frames(game, ws.screen, frames, positions)
+        after = snapshot()
+        tracemalloc.stop()
+
+        stats = after.compare_to(before, "lineno")
+        size = sum(stat.size_diff for stat in stats)
+        count = sum(stat.count_diff for stat in stats)
+        print("%-14s %8d %+12d %+10d" % (name, frames, size, count))
+
+
+if __name__ == "__main__":
+    main()
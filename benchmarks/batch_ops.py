@@ -0,0 +1,95 @@
+# Batched NumPy board ops against the per-board Python path
+#
+#   python benchmarks/batch_ops.py [--boards N] [--mode classic|hard]
+#
+# Deals N random boards per level, scrambles them with random pours, then
+# times legal moves, win state and heuristic for all of them: once through
+# Puzzle and solver, board by board, and once through BatchBoard. The two
+# are checked against each other before any timing is reported.
+
+import argparse
+import random
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+import generator
+import solver
+from batchboard import HAVE_NUMPY, BatchBoard
+from rules import Puzzle
+
+LEVELS = [1, 21, 41]
+SCRAMBLE = 10
+
+
+def random_boards(level, count, mode, rng):
+    num_colors, num_tubes, capacity = mode.level_params(level)
+    boards = []
+    for _ in range(count):
+        puzzle = Puzzle(generator.deal(rng, num_colors, num_tubes, capacity, mode.palette_size),
+                        capacity)
+        for _ in range(SCRAMBLE):
+            moves = puzzle.legal_moves()
+            if not moves:
+                break
+            puzzle.pour(*rng.choice(moves))
+        boards.append([list(tube.colors) for tube in puzzle.tubes])
+    return boards, capacity
+
+
+def python_path(boards, capacity):
+    legal, solved, estimate = [], [], []
+    for tubes in boards:
+        puzzle = Puzzle(tubes, capacity)
+        legal.append(len(puzzle.legal_moves()))
+        solved.append(puzzle.check_win())
+        estimate.append(solver.heuristic(tuple(tuple(colors) for colors in tubes)))
+    return legal, solved, estimate
+
+
+def numpy_path(boards, capacity):
+    batch = BatchBoard.from_tubes(boards, capacity)
+    legal = batch.legal_moves().sum(axis=(1, 2))
+    return legal, batch.is_solved(), batch.heuristic()
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BatchBoard vs per-board Python throughput")
+    parser.add_argument("--boards", type=int, default=5000, help="boards per level")
+    parser.add_argument("--mode", choices=sorted(generator.MODES), default="classic")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, best is kept")
+    args = parser.parse_args(argv)
+    if not HAVE_NUMPY:
+        parser.error("NumPy is not installed")
+
+    mode = generator.MODES[args.mode]
+    rng = random.Random(0)
+    print("%5s %6s %8s %8s %14s %14s %8s" % ("level", "tubes", "capacity", "boards",
+                                            "python/s", "numpy/s", "speedup"))
+    for level in LEVELS:
+        boards, capacity = random_boards(level, args.boards, mode, rng)
+        expected = python_path(boards, capacity)
+        got = numpy_path(boards, capacity)
+        for name, want, have in zip(("legal moves", "solved", "heuristic"), expected, got):
+            if list(want) != [type(w)(h) for w, h in zip(want, have)]:
+                raise SystemExit("BatchBoard %s disagrees with the Python path" % name)
+
+        python_time = best_of(lambda: python_path(boards, capacity), args.repeat)
+        # Include building the arrays, as a caller holding tube lists would
+        numpy_time = best_of(lambda: numpy_path(boards, capacity), args.repeat)
+        print("%5d %6d %8d %8d %14.0f %14.0f %7.1fx" % (
+            level, len(boards[0]), capacity, len(boards), len(boards) / python_time,
+            len(boards) / numpy_time, python_time / numpy_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# Shared helpers for the benchmark scripts
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAME_FILE = os.path.join(ROOT, "water sort.py.py")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_game():
+    # The game script has no importable name and opens a window on import,
+    # so load it by path with SDL pointed at its dummy drivers
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.chdir(ROOT)
+    spec = importlib.util.spec_from_file_location("water_sort", GAME_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
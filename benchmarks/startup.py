@@ -0,0 +1,82 @@
+# Time to first frame from a cold interpreter
+#
+#   python benchmarks/startup.py [--runs N] [--json results.json]
+#
+# Each run starts a fresh Python process that imports pygame, loads the game
+# module, builds Game and draws the menu once, reporting when each stage
+# finished. The parent also times the whole process up to that first frame,
+# interpreter startup included, which is closest to what a player waits for.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+STAGES = ["pygame", "module", "game", "first_frame"]
+RESULT_PREFIX = "startup: "
+
+
+def child():
+    start = time.perf_counter()
+    marks = {}
+    import pygame  # noqa: F401
+    marks["pygame"] = time.perf_counter()
+    from common import load_game
+    ws = load_game()
+    marks["module"] = time.perf_counter()
+    game = ws.Game()
+    marks["game"] = time.perf_counter()
+    game.draw(ws.screen)
+    marks["first_frame"] = time.perf_counter()
+    print(RESULT_PREFIX + json.dumps(dict((name, (t - start) * 1000.0) for name, t in marks.items())))
+    sys.stdout.flush()
+    game.saver.close()
+    ws.pygame.quit()
+
+
+def run_once():
+    # No pygame banner, and anything else printed before the result line is
+    # skipped
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, __file__, "--child"], stdout=subprocess.PIPE,
+                            universal_newlines=True, env=env)
+    for line in proc.stdout:
+        if line.startswith(RESULT_PREFIX):
+            break
+    else:
+        line = None
+    wall = (time.perf_counter() - start) * 1000.0
+    proc.wait()
+    if proc.returncode or not line:
+        raise RuntimeError("startup run failed with exit code %s" % proc.returncode)
+    result = json.loads(line[len(RESULT_PREFIX):])
+    result["process"] = wall
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Water sort time-to-first-frame benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes to start")
+    parser.add_argument("--json", help="also write every run to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child()
+        return
+
+    runs = [run_once() for _ in range(args.runs)]
+    print("%-12s %10s %10s %10s" % ("stage (ms)", "min", "median", "max"))
+    for name in STAGES + ["process"]:
+        values = sorted(run[name] for run in runs)
+        print("%-12s %10.1f %10.1f %10.1f" % (name, values[0], values[len(values) // 2], values[-1]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Headless throughput benchmarks for the game rules, generator and solver
+#
+#   python benchmarks/throughput.py [--repeat N] [--json results.json]
+#
+# Nothing here imports pygame, so it runs on CI machines with no display or
+# audio device. Each row is a board size taken from a representative level.
+
+import argparse
+import json
+import random
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+import generator
+import solver
+from replay import Replay, ReplayRunner
+from rules import Puzzle
+
+LEVELS = [1, 11, 21, 31]
+PLAYOUT_LENGTH = 40
+
+
+def timed(fn, repeat):
+    # Best of `repeat` runs, in seconds, with fn returning its op count
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return ops / best if best else 0.0
+
+
+def random_playout(tubes, capacity, rng):
+    puzzle = Puzzle(tubes, capacity)
+    moves = []
+    n = len(puzzle.tubes)
+    for _ in range(PLAYOUT_LENGTH):
+        legal = [(i, j) for i in range(n) for j in range(n) if puzzle.can_pour(i, j)]
+        if not legal:
+            break
+        move = rng.choice(legal)
+        puzzle.pour(*move)
+        moves.append(move)
+    return moves
+
+
+def bench_level(level, repeat):
+    rng = random.Random(level)
+    seed = generator.level_seed(level)
+    generated = generator.generate_level(level, seed)
+    tubes, capacity = generated.tubes, generated.capacity
+    moves = random_playout(tubes, capacity, rng)
+    mid = Puzzle(tubes, capacity)
+    for move in moves[:len(moves) // 2]:
+        mid.pour(*move)
+
+    def pours():
+        puzzle = Puzzle(tubes, capacity)
+        for src, dst in moves:
+            puzzle.pour(src, dst)
+        return len(moves)
+
+    def check_win():
+        for _ in range(1000):
+            mid.check_win()
+        return 1000
+
+    played = Puzzle(tubes, capacity)
+    for move in moves:
+        played.pour(*move)
+
+    def undo_redo():
+        while played.undo():
+            pass
+        while played.redo():
+            pass
+        return 2 * len(moves)
+
+    def generate():
+        for i in range(3):
+            generator.generate_level(level, generator.level_seed(level, i + 1))
+        return 3
+
+    expanded = [0]
+    searched = [0.0]
+
+    def solve():
+        result = solver.solve(tubes, capacity)
+        expanded[0] += result.expanded
+        searched[0] += result.elapsed
+        return 1
+
+    runner = ReplayRunner()
+    replay = Replay(level, seed, solver.solve(tubes, capacity).moves, capacity)
+    runner.board(replay)
+
+    def verify_replays():
+        for _ in range(100):
+            runner.verify(replay)
+        return 100
+
+    solves = timed(solve, repeat)
+    return {
+        "level": level,
+        "colors": len([t for t in tubes if t]),
+        "tubes": len(tubes),
+        "pours_per_sec": timed(pours, repeat),
+        "check_win_per_sec": timed(check_win, repeat),
+        "undo_redo_per_sec": timed(undo_redo, repeat),
+        "levels_per_sec": timed(generate, repeat),
+        "solves_per_sec": solves,
+        "replays_per_sec": timed(verify_replays, repeat),
+        "solver_nodes_per_sec": expanded[0] / searched[0] if searched[0] else 0.0,
+    }
+
+
+COLUMNS = [
+    ("level", "%5d"),
+    ("colors", "%6d"),
+    ("tubes", "%5d"),
+    ("pours_per_sec", "%13.0f"),
+    ("check_win_per_sec", "%17.0f"),
+    ("undo_redo_per_sec", "%17.0f"),
+    ("levels_per_sec", "%14.1f"),
+    ("solves_per_sec", "%14.1f"),
+    ("replays_per_sec", "%15.0f"),
+    ("solver_nodes_per_sec", "%20.0f"),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless water sort throughput benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, best is kept")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    results = [bench_level(level, args.repeat) for level in LEVELS]
+    widths = [len(fmt % 0) for _, fmt in COLUMNS]
+    print(" ".join(name.rjust(width) for (name, _), width in zip(COLUMNS, widths)))
+    for row in results:
+        print(" ".join(fmt % row[name] for name, fmt in COLUMNS))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
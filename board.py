@@ -0,0 +1,136 @@
+# Compact immutable board encoding
+#
+# Every tube takes a fixed-size record in a single bytes buffer:
+#   [height, top run length, slot 0, ..., slot capacity-1]
+# Slots hold colour indices (bottom first) and unused slots are EMPTY.
+# Keeping the top run length in the record makes top/segment lookups O(1),
+# and a board costs one small bytes object instead of nested lists of RGB
+# tuples, so it can be hashed, stored in history or used as a search key.
+
+EMPTY = 0xFF
+HEADER = 2
+
+
+class Board:
+    __slots__ = ("data", "capacity", "stride", "_hash")
+
+    def __init__(self, data, capacity):
+        self.data = bytes(data)
+        self.capacity = capacity
+        self.stride = capacity + HEADER
+        self._hash = None
+
+    @classmethod
+    def from_tubes(cls, tubes, capacity=4):
+        # tubes is a list of colour index lists, bottom first
+        stride = capacity + HEADER
+        buf = bytearray([EMPTY]) * (stride * len(tubes))
+        for i, colors in enumerate(tubes):
+            if len(colors) > capacity:
+                raise ValueError("tube %d holds more than %d colours" % (i, capacity))
+            base = i * stride
+            buf[base] = len(colors)
+            buf[base + 1] = _run_length(colors, len(colors))
+            buf[base + HEADER:base + HEADER + len(colors)] = bytes(colors)
+        return cls(buf, capacity)
+
+    def tubes(self):
+        return [list(self.tube(i)) for i in range(len(self))]
+
+    def tube(self, i):
+        base = i * self.stride
+        return self.data[base + HEADER:base + HEADER + self.data[base]]
+
+    def __len__(self):
+        return len(self.data) // self.stride
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.capacity == other.capacity and self.data == other.data
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.capacity, self.data))
+        return self._hash
+
+    def __repr__(self):
+        return "Board(%r, capacity=%d)" % (self.tubes(), self.capacity)
+
+    def height(self, i):
+        return self.data[i * self.stride]
+
+    def top(self, i):
+        base = i * self.stride
+        height = self.data[base]
+        if not height:
+            return None
+        return self.data[base + HEADER + height - 1]
+
+    def top_run(self, i):
+        return self.data[i * self.stride + 1]
+
+    def is_complete(self, i):
+        base = i * self.stride
+        return self.data[base] == self.capacity and self.data[base + 1] == self.capacity
+
+    def is_solved(self):
+        data = self.data
+        for base in range(0, len(data), self.stride):
+            if data[base] and data[base + 1] != self.capacity:
+                return False
+        return True
+
+    def pour_amount(self, src, dst):
+        # Number of segments a pour from src to dst would move, 0 if illegal
+        if src == dst:
+            return 0
+        data = self.data
+        s = src * self.stride
+        d = dst * self.stride
+        height = data[s]
+        dheight = data[d]
+        if not height or dheight == self.capacity:
+            return 0
+        color = data[s + HEADER + height - 1]
+        if dheight and data[d + HEADER + dheight - 1] != color:
+            return 0
+        return min(data[s + 1], self.capacity - dheight)
+
+    def pour(self, src, dst):
+        amount = self.pour_amount(src, dst)
+        if not amount:
+            return None
+        buf = bytearray(self.data)
+        s = src * self.stride
+        d = dst * self.stride
+        height = buf[s]
+        dheight = buf[d]
+        color = buf[s + HEADER + height - 1]
+
+        for k in range(amount):
+            buf[s + HEADER + height - 1 - k] = EMPTY
+            buf[d + HEADER + dheight + k] = color
+        height -= amount
+        buf[s] = height
+        buf[s + 1] = _run_length(buf[s + HEADER:s + HEADER + height], height)
+        buf[d] = dheight + amount
+        buf[d + 1] = buf[d + 1] + amount if dheight else amount
+        return Board(buf, self.capacity)
+
+    def canonical(self):
+        # Tube order does not matter for the puzzle, so sorted records
+        # identify all permutations of the same position
+        stride = self.stride
+        records = sorted(self.data[i:i + stride] for i in range(0, len(self.data), stride))
+        return Board(b"".join(records), self.capacity)
+
+
+def _run_length(colors, height):
+    if not height:
+        return 0
+    top = colors[height - 1]
+    count = 1
+    for k in range(height - 2, -1, -1):
+        if colors[k] != top:
+            break
+        count += 1
+    return count
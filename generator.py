@@ -0,0 +1,271 @@
+# Level generator
+#
+# Candidate boards are dealt at random, checked with the solver and scored.
+# Only boards whose score falls inside the band for their level are kept, so
+# every generated level is solvable and difficulty ramps within each colour
+# tier. If no candidate lands in the band within the attempt limit, the
+# closest solvable one is used, flagged and logged. Run as a script to
+# pre-generate seeded levels on all cores. The game imports this module at
+# startup, so the pool, CLI and logging modules are imported where used.
+
+import random
+import sys
+
+import solver
+
+PALETTE_SIZE = 10
+TUBE_CAPACITY = 4
+MAX_TUBES = 12
+EMPTY_TUBES = 2
+MAX_ATTEMPTS = 120
+NODE_LIMIT = 50000
+
+BRANCHING_WEIGHT = 0.5
+
+# (low, high) score band by position inside a five-level colour tier, wide
+# enough that every classic level up to 50 lands in its band at least 1 deal
+# in 15
+DIFFICULTY_BANDS = [
+    (0.0, 3.1),
+    (2.95, 3.3),
+    (3.1, 3.45),
+    (3.25, 3.6),
+    (3.4, None),
+]
+
+# Hard boards score higher and climb with the level, capacity and all; with
+# weight 2 every hard level up to 50 lands in its band at least 1 deal in 8
+HARD_BANDS = [
+    (0.0, 3.7),
+    (3.4, 3.75),
+    (3.5, 3.8),
+    (3.55, 3.9),
+    (3.65, None),
+]
+
+
+class Mode:
+    # How boards grow with the level for one way of playing. Colours and
+    # tubes ramp up as before; capacity goes up by one every capacity_step
+    # levels until max_capacity (a step of 0 keeps it fixed). Big boards are
+    # scored with an inflated solver heuristic (weight > 1), trading exact
+    # move counts for searches that finish. Scores shift with all of that, so
+    # each mode has its own difficulty bands
+    def __init__(self, name, capacity, palette_size, max_tubes, base_colors=4, max_capacity=None,
+                 capacity_step=0, weight=1.0, max_attempts=MAX_ATTEMPTS, bands=DIFFICULTY_BANDS):
+        self.name = name
+        self.capacity = capacity
+        self.palette_size = palette_size
+        self.max_tubes = max_tubes
+        self.base_colors = base_colors
+        self.max_capacity = max_capacity or capacity
+        self.capacity_step = capacity_step
+        self.weight = weight
+        self.max_attempts = max_attempts
+        self.bands = bands
+
+    def level_params(self, level, palette_size=None):
+        # (colours, tubes, capacity) for a level
+        palette_size = palette_size or self.palette_size
+        color_increase = (level - 1) // 5  # Increase colors every 5 levels
+        num_colors = min(self.base_colors + color_increase, palette_size)
+
+        base_tubes = num_colors + EMPTY_TUBES
+        tube_increase = (level - 1) // 3  # Increase tubes every 3 levels
+        num_tubes = min(base_tubes + tube_increase, self.max_tubes)
+
+        capacity = self.capacity
+        if self.capacity_step:
+            capacity = min(capacity + (level - 1) // self.capacity_step, self.max_capacity)
+        return num_colors, num_tubes, capacity
+
+    def band(self, level):
+        return self.bands[(level - 1) % len(self.bands)]
+
+
+CLASSIC = Mode("classic", TUBE_CAPACITY, PALETTE_SIZE, MAX_TUBES)
+HARD = Mode("hard", 5, 16, 20, base_colors=6, max_capacity=8, capacity_step=10, weight=2.0,
+            max_attempts=40, bands=HARD_BANDS)
+MODES = {mode.name: mode for mode in (CLASSIC, HARD)}
+MODE_IDS = ["classic", "hard"]  # stable numbering for binary formats
+
+
+def difficulty_band(level, mode=CLASSIC):
+    return mode.band(level)
+
+
+def in_band(score, band):
+    low, high = band
+    return score >= low and (high is None or score <= high)
+
+
+def band_distance(score, band):
+    low, high = band
+    if score < low:
+        return low - score
+    if high is not None and score > high:
+        return score - high
+    return 0.0
+
+
+def difficulty_score(result, num_colors, num_tubes, capacity=TUBE_CAPACITY):
+    # Optimal pours per colour drives the score, scaled to 4-segment tubes.
+    # That keeps capacities comparable but not equal, which is why bands
+    # belong to the mode. Boards whose search runs into many positions
+    # without a legal pour are harder still, and so are boards offering more
+    # pours to choose from per tube at each step
+    per_color = len(result.moves) / float(num_colors) * TUBE_CAPACITY / capacity
+    branching = result.branching_factor / num_tubes
+    return per_color + 2.0 * result.dead_end_ratio + BRANCHING_WEIGHT * branching
+
+
+def level_seed(level, index=0, base_seed=0):
+    return (base_seed * 1000003 + level) * 1000003 + index
+
+
+class Level:
+    def __init__(self, level, seed, tubes, capacity, moves, branching_factor, dead_end_ratio,
+                 score, attempts, mode="classic", in_band=True):
+        self.level = level
+        self.seed = seed
+        self.tubes = tubes              # palette index lists, bottom first
+        self.capacity = capacity
+        self.moves = moves              # solution length, optimal for weight 1
+        self.branching_factor = branching_factor
+        self.dead_end_ratio = dead_end_ratio
+        self.score = score
+        self.attempts = attempts
+        self.mode = mode
+        self.in_band = in_band  # False for a closest-candidate fallback
+
+    def to_dict(self):
+        return {
+            "level": self.level,
+            "seed": self.seed,
+            "tubes": self.tubes,
+            "capacity": self.capacity,
+            "moves": self.moves,
+            "branching_factor": round(self.branching_factor, 3),
+            "dead_end_ratio": round(self.dead_end_ratio, 4),
+            "score": round(self.score, 3),
+            "attempts": self.attempts,
+            "mode": self.mode,
+            "in_band": self.in_band,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["level"], data["seed"], data["tubes"], data["capacity"], data["moves"],
+                   data["branching_factor"], data["dead_end_ratio"], data["score"],
+                   data.get("attempts", 1), data.get("mode", "classic"), data.get("in_band", True))
+
+
+def deal(rng, num_colors, num_tubes, capacity=TUBE_CAPACITY, palette_size=PALETTE_SIZE):
+    colors = rng.sample(range(palette_size), num_colors)
+    color_pool = []
+    for color in colors:
+        color_pool.extend([color] * capacity)
+    rng.shuffle(color_pool)
+
+    tubes = [[] for _ in range(num_tubes)]
+    for i in range(num_colors):
+        tubes[i] = color_pool[i * capacity:(i + 1) * capacity]
+    return tubes
+
+
+def generate_level(level, seed=None, capacity=None, palette_size=None, max_attempts=None,
+                   node_limit=NODE_LIMIT, mode=CLASSIC, stop=None):
+    # capacity and palette_size default to the mode's values for this level.
+    # stop is an optional callable polled by the solver and between
+    # candidates; once it returns True generation gives up and returns None
+    if seed is None:
+        seed = level_seed(level)
+    rng = random.Random(seed)
+    palette_size = palette_size or mode.palette_size
+    num_colors, num_tubes, level_capacity = mode.level_params(level, palette_size)
+    capacity = capacity or level_capacity
+    max_attempts = max_attempts or mode.max_attempts
+    band = mode.band(level)
+
+    best = None
+    best_distance = None
+    for attempt in range(1, max_attempts + 1):
+        if stop is not None and stop():
+            return None
+        tubes = deal(rng, num_colors, num_tubes, capacity, palette_size)
+        result = solver.solve(tubes, capacity, mode.weight, node_limit=node_limit, stop=stop)
+        if not result.solved:
+            continue
+        score = difficulty_score(result, num_colors, num_tubes, capacity)
+        distance = band_distance(score, band)
+        if best is None or distance < best_distance:
+            best = Level(level, seed, tubes, capacity, len(result.moves),
+                         result.branching_factor, result.dead_end_ratio, score, attempt, mode.name)
+            best_distance = distance
+        if not distance:
+            break
+
+    if stop is not None and stop():
+        return None
+    if best is None:
+        raise RuntimeError("no solvable board found for level %d" % level)
+    best.attempts = attempt
+    if not in_band(best.score, band):
+        best.in_band = False
+        import logging
+        logging.getLogger("generator").warning("level %d seed %d: no board in band %s after %d attempts, using score %.3f",
+                    level, seed, band, attempt, best.score)
+    return best
+
+
+def _generate_job(job):
+    level, seed, capacity, palette_size, mode = job
+    return generate_level(level, seed, capacity, palette_size, mode=MODES[mode]).to_dict()
+
+
+def generate_batch(levels, per_level=1, base_seed=0, capacity=None, palette_size=None, workers=None,
+                   chunksize=16, mode="classic"):
+    # Yields level dicts in job order; a process pool spreads the solver work
+    # across all cores
+    jobs = [(level, level_seed(level, i, base_seed), capacity, palette_size, mode)
+            for level in levels for i in range(per_level)]
+    if workers == 1:
+        for job in jobs:
+            yield _generate_job(job)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for data in pool.map(_generate_job, jobs, chunksize=chunksize):
+            yield data
+
+
+def main(argv=None):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Pre-generate solvable water sort levels")
+    parser.add_argument("--first", type=int, default=1, help="first level")
+    parser.add_argument("--last", type=int, default=50, help="last level")
+    parser.add_argument("--per-level", type=int, default=1, help="boards per level")
+    parser.add_argument("--seed", type=int, default=0, help="base seed")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--mode", choices=sorted(MODES), default="classic", help="game mode")
+    parser.add_argument("--out", default="-", help="JSON Lines output file")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    fallbacks = 0
+    try:
+        levels = range(args.first, args.last + 1)
+        for data in generate_batch(levels, args.per_level, args.seed, workers=args.workers,
+                                   mode=args.mode):
+            fallbacks += not data["in_band"]
+            out.write(json.dumps(data) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if fallbacks:
+        sys.stderr.write("%d boards fell outside their difficulty band\n" % fallbacks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Background hint search
+#
+# A worker thread runs the solver on a snapshot of the board while the game
+# keeps drawing. Starting a new request or calling cancel() (whenever the
+# player moves) makes any running search stop at its next poll. Solved
+# paths are cached by canonical Board (one small bytes object per key
+# instead of nested tuples), so asking again anywhere along a
+# known solution answers immediately. If the deadline hits first, the first
+# move towards the most promising position found is returned as partial.
+
+import threading
+from collections import OrderedDict
+
+import solver
+from board import Board
+
+HINT_DEADLINE = 1.0  # seconds
+HINT_WEIGHT = 2.0
+CACHE_SIZE = 256
+
+
+class Hint:
+    def __init__(self, move, partial):
+        self.move = move        # (src, dst)
+        self.partial = partial  # best guess, the search hit its deadline
+
+
+class HintService:
+    def __init__(self, capacity, deadline=HINT_DEADLINE, cache_size=CACHE_SIZE):
+        self.capacity = capacity
+        self.deadline = deadline
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # canonical state -> (path, index into path)
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pending = False
+        self.result = None
+
+    def request(self, tubes):
+        # tubes is a list of palette index lists. Returns a Hint on a cache
+        # hit, otherwise starts a search and returns None; check poll()
+        self.cancel()
+        state = tuple(tuple(colors) for colors in tubes)
+        hint = self.lookup(state)
+        if hint is not None:
+            return hint
+
+        with self.lock:
+            generation = self.generation
+            self.pending = True
+        worker = threading.Thread(target=self.work, args=(generation, state))
+        worker.daemon = True
+        worker.start()
+        return None
+
+    def poll(self):
+        # (done, hint) for the current request; done stays False while the
+        # worker is searching, and hint may be None if nothing was found
+        with self.lock:
+            if self.pending:
+                return False, None
+            result, self.result = self.result, None
+        return True, result
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.pending = False
+            self.result = None
+
+    def key(self, state):
+        return Board.from_tubes(state, self.capacity).canonical()
+
+    def lookup(self, state):
+        key = self.key(state)
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            self.cache.move_to_end(key)
+        path, index = entry
+        return Hint(self.first_move(state, path[index:index + 2]), False)
+
+    def store(self, path):
+        keys = [self.key(state) for state in path[:-1]]
+        with self.lock:
+            for index, key in enumerate(keys):
+                self.cache[key] = (path, index)
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def first_move(self, state, path):
+        return solver.replay_path(state, path, self.capacity)[0]
+
+    def work(self, generation, state):
+        def cancelled():
+            return self.generation != generation
+
+        result = solver.search(state, self.capacity, HINT_WEIGHT, time_limit=self.deadline,
+                               stop=cancelled)
+        if cancelled():
+            return
+        hint = None
+        if result.path is not None:
+            self.store(result.path)
+            if len(result.path) > 1:
+                hint = Hint(self.first_move(state, result.path[:2]), False)
+        elif result.partial_path is not None and len(result.partial_path) > 1:
+            hint = Hint(self.first_move(state, result.partial_path[:2]), True)
+
+        with self.lock:
+            if generation == self.generation:
+                self.result = hint
+                self.pending = False
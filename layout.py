@@ -0,0 +1,77 @@
+# Tube grid layout
+#
+# Fits any number of tubes into the board area of any screen: every row
+# count is tried and the one giving the largest tubes wins, then the rows
+# are centred. Pure geometry with no pygame, cached per screen size, tube
+# count and capacity since a layout only changes with those.
+
+import functools
+import math
+
+BASE_SIZE = (800, 600)  # screen the maximum tube width is given for
+MAX_TUBE_WIDTH = 60
+TUBE_ASPECT = 200 / 60  # height over width
+GAP_RATIO = 1 / 3  # space between tubes, relative to tube width
+BOARD_TOP = 100
+MARGIN = 20
+MIN_SEGMENT_HEIGHT = 2
+
+
+class Layout:
+    def __init__(self, tube_width, segment_height, capacity, gap, rows, cols, positions):
+        self.tube_width = tube_width
+        self.segment_height = segment_height
+        self.tube_height = segment_height * capacity
+        self.capacity = capacity
+        self.gap = gap
+        self.rows = rows
+        self.cols = cols
+        self.positions = positions  # top-left of each tube, in tube order
+
+    def __repr__(self):
+        return "Layout(%d tubes, %dx%d in %d rows)" % (len(self.positions), self.tube_width,
+                                                       self.tube_height, self.rows)
+
+
+def best_width(count, area_width, area_height, max_width, aspect, gap_ratio):
+    # (rows, tube width) with the widest tubes; fewer rows win ties
+    best = None
+    for rows in range(1, count + 1):
+        cols = math.ceil(count / rows)
+        by_width = area_width / (cols + (cols - 1) * gap_ratio)
+        by_height = area_height / (rows * aspect + (rows - 1) * gap_ratio)
+        width = min(max_width, by_width, by_height)
+        if best is None or width > best[1]:
+            best = (rows, width)
+        if by_height < by_width:
+            # More rows only make the tubes shorter from here on
+            break
+    return best
+
+
+@functools.lru_cache(maxsize=64)
+def compute_layout(width, height, count, capacity, top=BOARD_TOP, margin=MARGIN,
+                   max_width=MAX_TUBE_WIDTH, aspect=TUBE_ASPECT, gap_ratio=GAP_RATIO):
+    # The returned Layout is shared between callers, treat it as read-only
+    # Bigger screens allow proportionally bigger tubes
+    max_width *= max(1.0, min(width / BASE_SIZE[0], height / BASE_SIZE[1]))
+    area_width = width - 2 * margin
+    area_height = height - top - margin
+    rows, tube_width = best_width(max(1, count), area_width, area_height, max_width, aspect,
+                                  gap_ratio)
+    # Whole-pixel segments, so the liquid lines up with the glass at any size
+    segment_height = max(MIN_SEGMENT_HEIGHT, int(tube_width * aspect / capacity))
+    tube_width = max(1, int(tube_width))
+    gap = int(tube_width * gap_ratio)
+    cols = math.ceil(count / rows) if count else 0
+    tube_height = segment_height * capacity
+
+    positions = []
+    for i in range(count):
+        row, col = divmod(i, cols)
+        in_row = min(cols, count - row * cols)
+        row_width = in_row * tube_width + (in_row - 1) * gap
+        x = margin + (area_width - row_width) // 2 + col * (tube_width + gap)
+        y = top + row * (tube_height + gap)
+        positions.append((x, y))
+    return Layout(tube_width, segment_height, capacity, gap, rows, cols, tuple(positions))
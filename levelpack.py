@@ -0,0 +1,208 @@
+# Binary level packs
+#
+# A pack is a fixed header followed by one fixed-size record per level, so
+# entry N lives at HEADER_SIZE + N * record_size and can be read straight out
+# of an mmap without parsing the rest of the file.
+#
+# Header (little endian, 17 bytes):
+#   magic "WSPK", format version u16, pack revision u16, slots per tube u8,
+#   max tubes u8, record size u16, level count u32, game mode u8
+# Record:
+#   seed u64, score f32, optimal moves u16, tube count u8, tube capacity u8,
+#   then max_tubes * slots colour indices (bottom first, EMPTY padded)
+# Slots per tube is the largest capacity of any level in the pack.
+
+import json
+import mmap
+import os
+import struct
+import sys
+
+import generator
+from board import Board, EMPTY
+
+MAGIC = b"WSPK"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sHHBBHIB")
+RECORD = struct.Struct("<QfHBB")
+HEADER_SIZE = HEADER.size
+
+
+class PackEntry:
+    def __init__(self, level, seed, score, moves, tubes, capacity):
+        self.level = level
+        self.seed = seed
+        self.score = score
+        self.moves = moves
+        self.tubes = tubes
+        self.capacity = capacity
+
+    def board(self):
+        return Board.from_tubes(self.tubes, self.capacity)
+
+
+class LevelPack:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        magic, version, revision, slots, max_tubes, record_size, count, mode = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or mode >= len(generator.MODE_IDS):
+            self.close()
+            raise ValueError("%s is not a level pack" % path)
+        if HEADER_SIZE + count * record_size > len(self._map):
+            self.close()
+            raise ValueError("%s is truncated" % path)
+        self.revision = revision
+        self.slots = slots
+        self.max_tubes = max_tubes
+        self.mode = generator.MODE_IDS[mode]
+        self.record_size = record_size
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def entry(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("level pack entry %d out of range" % index)
+        offset = HEADER_SIZE + index * self.record_size
+        seed, score, moves, num_tubes, capacity = RECORD.unpack_from(self._map, offset)
+        payload = offset + RECORD.size
+        tubes = []
+        for i in range(num_tubes):
+            start = payload + i * self.slots
+            slots = self._map[start:start + capacity]
+            tubes.append([c for c in slots if c != EMPTY])
+        return PackEntry(index + 1, seed, score, moves, tubes, capacity)
+
+    def level(self, level):
+        return self.entry(level - 1)
+
+
+def open_pack(path):
+    # None when there is no usable pack, so callers can fall back to
+    # generating levels at runtime
+    if not os.path.exists(path):
+        return None
+    try:
+        return LevelPack(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def write_pack(path, levels, slots, max_tubes, revision=0, mode="classic"):
+    # levels is an iterable of generator level dicts, exactly one per level
+    # from level 1 up, since records are found by level number; slots is the
+    # largest tube capacity any of them may use
+    record_size = RECORD.size + max_tubes * slots
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        try:
+            count = _write_records(f, levels, slots, max_tubes, revision, mode, record_size)
+        except Exception:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_records(f, levels, slots, max_tubes, revision, mode, record_size):
+    mode_id = generator.MODE_IDS.index(mode)
+    count = 0
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, revision, slots, max_tubes, record_size, 0,
+                        mode_id))
+    for data in levels:
+        if data["level"] != count + 1:
+            raise ValueError("expected level %d, got level %d: a pack needs one board per "
+                             "level starting at 1" % (count + 1, data["level"]))
+        if data.get("mode", "classic") != mode:
+            raise ValueError("level %d is a %s level, the pack is %s"
+                             % (data["level"], data.get("mode", "classic"), mode))
+        tubes = data["tubes"]
+        capacity = data["capacity"]
+        if len(tubes) > max_tubes or capacity > slots:
+            raise ValueError("level %d does not fit the pack layout" % data["level"])
+        payload = bytearray([EMPTY]) * (max_tubes * slots)
+        for i, colors in enumerate(tubes):
+            payload[i * slots:i * slots + len(colors)] = bytes(colors)
+        f.write(RECORD.pack(data["seed"], data["score"], data["moves"], len(tubes), capacity))
+        f.write(payload)
+        count += 1
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, revision, slots, max_tubes, record_size, count,
+                        mode_id))
+    return count
+
+
+def _read_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None):
+    import argparse  # CLI only; the game imports this module at startup
+    parser = argparse.ArgumentParser(description="Build or inspect water sort level packs")
+    sub = parser.add_subparsers(dest="command")
+
+    build = sub.add_parser("build", help="generate levels into a pack")
+    build.add_argument("out")
+    build.add_argument("--levels", type=int, default=1000, help="number of levels")
+    build.add_argument("--seed", type=int, default=0, help="base seed")
+    build.add_argument("--revision", type=int, default=0, help="pack revision")
+    build.add_argument("--workers", type=int, default=None, help="worker processes")
+    build.add_argument("--mode", choices=sorted(generator.MODES), default="classic",
+                       help="game mode")
+    build.add_argument("--from-jsonl", help="pack levels from generator.py output instead")
+
+    show = sub.add_parser("show", help="print one level from a pack")
+    show.add_argument("pack")
+    show.add_argument("level", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        mode = generator.MODES[args.mode]
+        if args.from_jsonl:
+            levels = _read_jsonl(args.from_jsonl)
+        else:
+            levels = generator.generate_batch(range(1, args.levels + 1), base_seed=args.seed,
+                                              workers=args.workers, mode=mode.name)
+        try:
+            count = write_pack(args.out, levels, mode.max_capacity, mode.max_tubes, args.revision,
+                               mode.name)
+        except ValueError as e:
+            parser.error(str(e))
+        print("wrote %d levels to %s" % (count, args.out))
+    elif args.command == "show":
+        with LevelPack(args.pack) as pack:
+            entry = pack.level(args.level)
+            print(json.dumps({"level": entry.level, "mode": pack.mode, "seed": entry.seed,
+                              "moves": entry.moves, "score": round(entry.score, 3),
+                              "capacity": entry.capacity, "tubes": entry.tubes}))
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# Frame profiler
+#
+# Opt in with WS_PROFILE=1 (or F3 in game). Every timed section keeps its
+# last RING_SIZE durations in a ring buffer for percentile readouts, and
+# while a trace is being recorded each one also becomes a Chrome trace event
+# (open the JSON in chrome://tracing or ui.perfetto.dev). Methods are timed
+# by swapping in wrappers when the profiler is enabled and putting the
+# originals back when it is disabled, so they cost nothing while it is off.
+
+import functools
+import json
+import os
+import threading
+import time
+from array import array
+from collections import deque
+
+RING_SIZE = 600  # samples per section, 10 s of frames at 60 FPS
+MAX_TRACE_EVENTS = 500000
+
+
+class Ring:
+    def __init__(self, size=RING_SIZE):
+        self.values = array("d", bytes(8 * size))
+        self.size = size
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.count % self.size] = value
+        self.count += 1
+
+    def samples(self):
+        return self.values[:min(self.count, self.size)]
+
+    def percentiles(self, *points):
+        data = sorted(self.samples())
+        if not data:
+            return [0.0] * len(points)
+        last = len(data) - 1
+        return [data[min(last, int(p / 100.0 * len(data)))] for p in points]
+
+
+class NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SECTION = NullSection()
+
+
+class Section:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    def __init__(self, ring_size=RING_SIZE):
+        self.enabled = False
+        self.ring_size = ring_size
+        self.rings = {}  # section name -> Ring of durations in ms
+        self.frames = Ring(ring_size)  # ms between frame() calls
+        self.last_frame = None
+        self.trace = None  # deque of (name, start, duration, thread) while tracing
+        self.targets = []  # (owner, method names) to time when enabled
+        self.originals = []  # (owner, name, original) currently wrapped
+        self.origin = time.perf_counter()
+
+    def register(self, owner, *names):
+        self.targets.append((owner, names))
+        if self.enabled:
+            self.wrap(owner, names)
+
+    def enable(self, trace=False):
+        if not self.enabled:
+            self.enabled = True
+            self.last_frame = None
+            for owner, names in self.targets:
+                self.wrap(owner, names)
+        if trace:
+            self.start_trace()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+    def wrap(self, owner, names):
+        for name in names:
+            original = owner.__dict__[name]
+            setattr(owner, name, self.timed(owner.__name__ + "." + name, original))
+            self.originals.append((owner, name, original))
+
+    def timed(self, label, func):
+        record = self.record
+        clock = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, start, clock())
+        return wrapper
+
+    def section(self, name):
+        # with profiler.section("events"): ... times the block when enabled
+        if not self.enabled:
+            return NULL_SECTION
+        return Section(self, name)
+
+    def record(self, name, start, end):
+        ring = self.rings.get(name)
+        if ring is None:
+            ring = self.rings[name] = Ring(self.ring_size)
+        ring.add((end - start) * 1000.0)
+        if self.trace is not None:
+            self.trace.append((name, start, end - start, threading.get_ident()))
+
+    def frame(self):
+        # Called once per main loop iteration
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frames.add((now - self.last_frame) * 1000.0)
+        self.last_frame = now
+
+    def fps(self):
+        median = self.frames.percentiles(50)[0]
+        return 1000.0 / median if median else 0.0
+
+    def summary(self, limit=None):
+        # [(name, p50, p95, p99)] in ms, slowest p95 first
+        rows = [(name,) + tuple(ring.percentiles(50, 95, 99)) for name, ring in self.rings.items()]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def start_trace(self, max_events=MAX_TRACE_EVENTS):
+        if self.trace is None:
+            self.trace = deque(maxlen=max_events)
+
+    def stop_trace(self):
+        events, self.trace = self.trace, None
+        return events
+
+    def dump_trace(self, path, events=None):
+        # Chrome trace-event JSON: one complete ("X") event per section call
+        if events is None:
+            events = self.trace or ()
+        pid = os.getpid()
+        origin = self.origin
+        data = {
+            "traceEvents": [
+                {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": round((start - origin) * 1e6, 1), "dur": round(duration * 1e6, 1)}
+                for name, start, duration, tid in list(events)
+            ],
+            "displayTimeUnit": "ms",
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return len(data["traceEvents"])
+
+
+profiler = Profiler()
@@ -0,0 +1,215 @@
+# Replays
+#
+# A replay is the level, the seed its board was generated from and the pours
+# made, which is all it takes to rebuild and check a game because level
+# generation is deterministic for a given seed. Binary form (little endian):
+#   magic "WSRP", format version u8, level u32, seed u64, pack revision u16,
+#   tube capacity u8, game mode u8, pour count u16, then one (src, dst) byte
+#   pair per pour
+# Version 1 replays have no mode byte and are always classic mode.
+# A replay is only valid on the board the game would have dealt: the pack
+# entry's seed and capacity when the level is in the pack, otherwise the
+# level's own seed for the replay's revision and its mode's capacity.
+# The text form is that, base64 encoded, for save files and bug reports.
+#
+#   python replay.py verify replays.txt [--pack levels.pack]
+#   python replay.py show <replay>
+
+import base64
+import binascii
+import struct
+import sys
+import time
+
+import generator
+from board import Board
+from levelpack import open_pack
+
+MAGIC = b"WSRP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sBIQHBBH")
+HEADER_V1 = struct.Struct("<4sBIQHBH")
+BOARD_CACHE_SIZE = 4096
+
+
+class Replay:
+    def __init__(self, level, seed, moves, capacity=generator.TUBE_CAPACITY, revision=0,
+                 mode="classic"):
+        self.level = level
+        self.seed = seed
+        self.moves = moves  # list of (src, dst)
+        self.capacity = capacity
+        self.revision = revision
+        self.mode = mode
+
+    def to_bytes(self):
+        data = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, self.level, self.seed, self.revision,
+                                     self.capacity, generator.MODE_IDS.index(self.mode),
+                                     len(self.moves)))
+        for src, dst in self.moves:
+            data.append(src)
+            data.append(dst)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            if data[4:5] == b"\x01":
+                header = HEADER_V1
+                magic, version, level, seed, revision, capacity, count = header.unpack_from(data, 0)
+                mode = 0
+            else:
+                header = HEADER
+                magic, version, level, seed, revision, capacity, mode, count = \
+                    header.unpack_from(data, 0)
+        except struct.error:
+            raise ValueError("replay is truncated")
+        if magic != MAGIC or version not in (1, FORMAT_VERSION) or mode >= len(generator.MODE_IDS):
+            raise ValueError("not a replay")
+        body = data[header.size:]
+        if len(body) != 2 * count:
+            raise ValueError("replay has %d bytes of pours, expected %d" % (len(body), 2 * count))
+        moves = list(zip(body[0::2], body[1::2]))
+        return cls(level, seed, moves, capacity, revision, generator.MODE_IDS[mode])
+
+    def encode(self):
+        return base64.urlsafe_b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def decode(cls, text):
+        try:
+            data = base64.urlsafe_b64decode(text.strip().encode("ascii"))
+        except (binascii.Error, UnicodeEncodeError):
+            raise ValueError("replay is not valid base64")
+        return cls.from_bytes(data)
+
+
+class ReplayResult:
+    def __init__(self, valid, solved, moves, error=None):
+        self.valid = valid    # every pour was legal
+        self.solved = solved  # and the last one finished the level
+        self.moves = moves
+        self.error = error
+
+
+class ReplayRunner:
+    # Rebuilds boards from their seeds and plays replays against them with no
+    # display. Generating a board costs far more than checking a replay, so
+    # boards are cached as compact Boards: a leaderboard's replays mostly
+    # share a few levels. Pours are applied to the immutable Board too.
+    def __init__(self, pack=None, cache_size=BOARD_CACHE_SIZE):
+        self.pack = pack
+        self.cache_size = cache_size
+        self.boards = {}
+
+    def board(self, replay):
+        key = (replay.mode, replay.level, replay.seed, replay.capacity)
+        board = self.boards.get(key)
+        if board is None:
+            entry = self.pack_entry(replay)
+            tubes = entry.tubes if entry is not None else None
+            if tubes is None:
+                tubes = generator.generate_level(replay.level, replay.seed, replay.capacity,
+                                                 mode=generator.MODES[replay.mode]).tubes
+            board = Board.from_tubes(tubes, replay.capacity)
+            if len(self.boards) >= self.cache_size:
+                self.boards.clear()
+            self.boards[key] = board
+        return board
+
+    def pack_entry(self, replay):
+        pack = self.pack
+        if pack is None or pack.mode != replay.mode or not 1 <= replay.level <= len(pack):
+            return None
+        return pack.level(replay.level)
+
+    def check_board(self, replay):
+        # Why the replay's seed or capacity is not the level's, None if both
+        # are; otherwise any seed with a short solution would pass
+        entry = self.pack_entry(replay)
+        if entry is not None:
+            if replay.revision != self.pack.revision:
+                return "replay is for revision %d, the pack is revision %d" % (
+                    replay.revision, self.pack.revision)
+            if replay.seed != entry.seed:
+                return "seed %d is not the pack's seed for level %d" % (replay.seed, replay.level)
+            if replay.capacity != entry.capacity:
+                return "capacity %d is not the pack's for level %d" % (replay.capacity, replay.level)
+            return None
+        if replay.level < 1:
+            return "level %d does not exist" % replay.level
+        if replay.seed != generator.level_seed(replay.level, base_seed=replay.revision):
+            return "seed %d is not level %d's seed" % (replay.seed, replay.level)
+        capacity = generator.MODES[replay.mode].level_params(replay.level)[2]
+        if replay.capacity != capacity:
+            return "capacity %d is not level %d's (%d)" % (replay.capacity, replay.level, capacity)
+        return None
+
+    def verify(self, replay):
+        error = self.check_board(replay)
+        if error is not None:
+            return ReplayResult(False, False, 0, error)
+        board = self.board(replay)
+        count = len(board)
+        for i, (src, dst) in enumerate(replay.moves):
+            board = board.pour(src, dst) if src < count and dst < count else None
+            if board is None:
+                return ReplayResult(False, False, i, "pour %d (%d -> %d) is illegal" % (i + 1, src, dst))
+            if board.is_solved() and i + 1 < len(replay.moves):
+                return ReplayResult(False, True, i + 1, "pours continue after the level is solved")
+        return ReplayResult(True, board.is_solved(), len(replay.moves))
+
+
+def _verify_file(args):
+    pack = open_pack(args.pack) if args.pack else None
+    runner = ReplayRunner(pack)
+    total = valid = solved = 0
+    start = time.perf_counter()
+    with open(args.replays) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            total += 1
+            try:
+                result = runner.verify(Replay.decode(line))
+            except ValueError as e:
+                result = ReplayResult(False, False, 0, str(e))
+            valid += result.valid
+            solved += result.valid and result.solved
+            if not result.valid:
+                print("line %d: %s" % (number, result.error))
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0.0
+    print("%d replays, %d valid, %d solved in %.2fs (%.0f/s)" % (total, valid, solved, elapsed, rate))
+    return valid == total
+
+
+def main(argv=None):
+    import argparse  # CLI only
+    parser = argparse.ArgumentParser(description="Verify or inspect water sort replays")
+    sub = parser.add_subparsers(dest="command")
+
+    verify = sub.add_parser("verify", help="check a file of replays, one per line")
+    verify.add_argument("replays")
+    verify.add_argument("--pack", help="level pack the replays were played from")
+
+    show = sub.add_parser("show", help="decode one replay")
+    show.add_argument("replay")
+
+    args = parser.parse_args(argv)
+    if args.command == "verify":
+        if not _verify_file(args):
+            sys.exit(1)
+    elif args.command == "show":
+        replay = Replay.decode(args.replay)
+        print("%s level %d, seed %d, revision %d, capacity %d, %d pours" % (
+            replay.mode, replay.level, replay.seed, replay.revision, replay.capacity,
+            len(replay.moves)))
+        print(" ".join("%d>%d" % move for move in replay.moves))
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+# Water sort rules
+#
+# Pure game logic with no pygame import, so boards can be played, replayed
+# and benchmarked headless. Tubes hold palette indices (bottom first); the
+# pygame front end subclasses TubeState to add position and drawing.
+
+from array import array
+
+import solver
+from board import Board
+
+TUBE_CAPACITY = 4
+CHECKPOINT_INTERVAL = 64  # for callers that seek(); off by default
+LOOKAHEAD_BUDGET = 0.005  # seconds
+LOOKAHEAD_WEIGHT = 2.0
+
+
+class TubeState:
+    # Alongside the colours each tube keeps its runs of equal colours and a
+    # count per colour, updated on every push/pop, so the top run, the
+    # completed check and the distinct colour count are all O(1)
+    def __init__(self, capacity=TUBE_CAPACITY):
+        self.capacity = capacity
+        self.colors = []
+        self.runs = []  # [color, length] from the bottom up
+        self.color_counts = {}
+
+    def set_colors(self, colors):
+        self.colors = []
+        self.runs = []
+        self.color_counts = {}
+        for color in colors:
+            self._push(color)
+
+    def _push(self, color):
+        self.colors.append(color)
+        if self.runs and self.runs[-1][0] == color:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([color, 1])
+        self.color_counts[color] = self.color_counts.get(color, 0) + 1
+
+    def _pop(self):
+        color = self.colors.pop()
+        run = self.runs[-1]
+        run[1] -= 1
+        if not run[1]:
+            self.runs.pop()
+        count = self.color_counts[color] - 1
+        if count:
+            self.color_counts[color] = count
+        else:
+            del self.color_counts[color]
+        return color
+
+    def add_color(self, color):
+        if len(self.colors) < self.capacity:
+            self._push(color)
+
+    def is_empty(self):
+        return not self.colors
+
+    def is_full(self):
+        return len(self.colors) == self.capacity
+
+    def is_complete(self):
+        return len(self.colors) == self.capacity and len(self.runs) == 1
+
+    def top_color(self):
+        if not self.runs:
+            return None
+        return self.runs[-1][0]
+
+    def top_color_count(self):
+        if not self.runs:
+            return 0
+        return self.runs[-1][1]
+
+    def distinct_colors(self):
+        return len(self.color_counts)
+
+    def can_receive(self, color, amount):
+        if self.is_empty():
+            return amount <= self.capacity
+        if self.top_color() != color:
+            return False
+        return len(self.colors) + amount <= self.capacity
+
+    def pour_amount(self, other_tube):
+        # Segments a pour into other_tube would move, 0 if it is not allowed
+        if self is other_tube or self.is_empty() or other_tube.is_full():
+            return 0
+        if not other_tube.is_empty() and other_tube.top_color() != self.top_color():
+            return 0
+        return min(self.top_color_count(), other_tube.capacity - len(other_tube.colors))
+
+    def move_to(self, other_tube, amount):
+        # Moves the top segments without checking the rules (used by undo)
+        for _ in range(amount):
+            other_tube.add_color(self._pop())
+
+    def pour_to(self, other_tube):
+        # Returns the number of segments poured
+        pour_amount = self.pour_amount(other_tube)
+        self.move_to(other_tube, pour_amount)
+        return pour_amount
+
+
+class History:
+    # Pours as 16-bit deltas in one flat array: source and destination tube
+    # (6 bits each) and segment count - 1 (4 bits). The colour is always the
+    # top of the tube being poured from, so it is not stored. A cursor makes
+    # undo and redo O(1); entries past it are the redo tail. Optional board
+    # checkpoints let seek() jump far back without replaying every step.
+    MAX_TUBES = 64
+    MAX_AMOUNT = 16
+
+    def __init__(self, checkpoint_interval=None):
+        self.deltas = array("H")
+        self.position = 0
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = {}
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.deltas)
+
+    def record(self, src, dst, amount):
+        if src >= self.MAX_TUBES or dst >= self.MAX_TUBES or not 0 < amount <= self.MAX_AMOUNT:
+            raise ValueError("pour %d -> %d x%d does not fit a history delta" % (src, dst, amount))
+        if self.position < len(self.deltas):
+            del self.deltas[self.position:]
+            for position in [p for p in self.checkpoints if p > self.position]:
+                del self.checkpoints[position]
+        self.deltas.append(src << 10 | dst << 4 | (amount - 1))
+        self.position += 1
+
+    def wants_checkpoint(self):
+        interval = self.checkpoint_interval
+        return bool(interval) and self.position % interval == 0
+
+    def checkpoint_before(self, position):
+        best = None
+        for p in self.checkpoints:
+            if p <= position and (best is None or p > best):
+                best = p
+        return best
+
+    def undo(self):
+        if not self.position:
+            return None
+        self.position -= 1
+        return self.decode(self.deltas[self.position])
+
+    def redo(self):
+        if self.position >= len(self.deltas):
+            return None
+        delta = self.deltas[self.position]
+        self.position += 1
+        return self.decode(delta)
+
+    def moves(self):
+        return [self.decode(delta)[:2] for delta in self.deltas[:self.position]]
+
+    @staticmethod
+    def decode(delta):
+        return delta >> 10, (delta >> 4) & 0x3F, (delta & 0xF) + 1
+
+
+class Puzzle:
+    def __init__(self, tubes, capacity=TUBE_CAPACITY, tube_factory=None,
+                 checkpoint_interval=None):
+        # tubes is a list of palette index lists; tube_factory(i) returns an
+        # empty tube for slot i when the caller needs its own tube class
+        self.capacity = capacity
+        self.tubes = []
+        for i, colors in enumerate(tubes):
+            tube = tube_factory(i) if tube_factory else TubeState(capacity)
+            for color in colors:
+                tube.add_color(color)
+            self.tubes.append(tube)
+        self.num_colors = len({color for colors in tubes for color in colors})
+        self.completed = sum(1 for tube in self.tubes if tube.is_complete())
+        self.history = History(checkpoint_interval)
+        if checkpoint_interval:
+            self.history.checkpoints[0] = self.to_board()
+
+    @property
+    def moves(self):
+        return self.history.position
+
+    @classmethod
+    def from_level(cls, level, seed=None, capacity=None, tube_factory=None):
+        # capacity defaults to the one the level is generated with
+        from generator import generate_level  # the solver-heavy path, kept off startup
+        generated = generate_level(level, seed, capacity)
+        return cls(generated.tubes, generated.capacity, tube_factory)
+
+    def to_board(self):
+        return Board.from_tubes([tube.colors for tube in self.tubes], self.capacity)
+
+    def load_board(self, board):
+        for tube, colors in zip(self.tubes, board.tubes()):
+            tube.set_colors(colors)
+        self.completed = sum(1 for tube in self.tubes if tube.is_complete())
+
+    def can_pour(self, src, dst):
+        return self.tubes[src].pour_amount(self.tubes[dst]) > 0
+
+    def pour(self, src, dst):
+        # Returns the number of segments poured, 0 for an illegal move
+        source, target = self.tubes[src], self.tubes[dst]
+        before = source.is_complete() + target.is_complete()
+        amount = source.pour_to(target)
+        if amount:
+            self.completed += source.is_complete() + target.is_complete() - before
+            self.history.record(src, dst, amount)
+            if self.history.wants_checkpoint():
+                self.history.checkpoints[self.history.position] = self.to_board()
+        return amount
+
+    def undo(self):
+        delta = self.history.undo()
+        if delta is None:
+            return False
+        src, dst, amount = delta
+        self.transfer(dst, src, amount)
+        return True
+
+    def redo(self):
+        delta = self.history.redo()
+        if delta is None:
+            return False
+        src, dst, amount = delta
+        self.transfer(src, dst, amount)
+        return True
+
+    def transfer(self, src, dst, amount):
+        source, target = self.tubes[src], self.tubes[dst]
+        before = source.is_complete() + target.is_complete()
+        source.move_to(target, amount)
+        self.completed += source.is_complete() + target.is_complete() - before
+
+    def seek(self, position):
+        # Moves through history to `position` pours, restoring the nearest
+        # checkpoint first when that is shorter than stepping there
+        history = self.history
+        position = max(0, min(position, len(history)))
+        base = history.checkpoint_before(position)
+        if base is not None and position - base < abs(position - history.position):
+            self.load_board(history.checkpoints[base])
+            history.position = base
+        while history.position > position:
+            self.undo()
+        while history.position < position:
+            self.redo()
+
+    def check_win(self):
+        # Every colour fills exactly one tube once sorted
+        return self.completed == self.num_colors
+
+    def has_moves(self):
+        # O(n) check for any pour that does not just empty a finished tube:
+        # an empty tube takes anything, otherwise two tubes must share a top
+        # colour with room in at least one of them
+        has_empty = False
+        has_source = False
+        tops = {}
+        for tube in self.tubes:
+            if tube.is_empty():
+                has_empty = True
+                continue
+            if tube.is_complete():
+                continue
+            has_source = True
+            color = tube.top_color()
+            count, room = tops.get(color, (0, False))
+            tops[color] = (count + 1, room or not tube.is_full())
+        if has_source and has_empty:
+            return True
+        return any(count > 1 and room for count, room in tops.values())
+
+    def legal_moves(self):
+        # (src, dst) pours that move at least one segment, skipping finished
+        # tubes as sources since emptying them never helps
+        moves = []
+        for i, source in enumerate(self.tubes):
+            if source.is_empty() or source.is_complete():
+                continue
+            color = source.top_color()
+            for j, target in enumerate(self.tubes):
+                if i != j and target.can_receive(color, 1):
+                    moves.append((i, j))
+        return moves
+
+    def solvable(self, time_budget=LOOKAHEAD_BUDGET):
+        # True or False when a bounded search settles it, None when the time
+        # budget runs out first
+        if self.check_win():
+            return True
+        # Once no tube mixes colours, merging each colour's tubes always
+        # finishes the board, so no search is needed
+        if all(tube.distinct_colors() <= 1 for tube in self.tubes):
+            return True
+        if not self.has_moves():
+            return False
+        # Straight to search: only the verdict is needed, not the moves, and
+        # the deadline is polled every expansion to stay within the budget
+        state = tuple(tuple(tube.colors) for tube in self.tubes)
+        result = solver.search(state, self.capacity, LOOKAHEAD_WEIGHT, time_limit=time_budget,
+                               poll_interval=1)
+        if result.path is not None:
+            return True
+        return False if result.exhausted else None
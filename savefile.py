@@ -0,0 +1,94 @@
+# Progress saving
+#
+# The game hands SaveService a snapshot dict whenever progress changes and
+# carries on drawing. A background thread waits until requests have been
+# quiet for a short delay, then writes only the newest snapshot: JSON to a
+# temp file, fsync, then os.replace over the real save, so a crash at any
+# point leaves either the old or the new file and never half of one.
+
+import json
+import os
+import threading
+import time
+
+SAVE_VERSION = 2
+SAVE_DELAY = 1.0  # seconds of quiet before a burst of saves is written
+CLOSE_TIMEOUT = 2.0
+
+
+def read_save(path):
+    # Empty dict when there is no save yet or it cannot be used
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def write_save(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SaveService:
+    def __init__(self, path, delay=SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.pending = None
+        self.requested_at = 0.0
+        self.closed = False
+        self.writes = 0
+        self.error = None  # exception from the last write, None once one succeeds
+        self.worker = threading.Thread(target=self.work)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def load(self):
+        return read_save(self.path)
+
+    def save(self, data):
+        # Never blocks on disk; a newer snapshot replaces one not yet written
+        with self.condition:
+            self.pending = data
+            self.requested_at = time.monotonic()
+            self.condition.notify()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        # Writes whatever is still pending right away, then stops the thread
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join(timeout)
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                # Let a burst of requests settle before touching the disk
+                wait = self.requested_at + self.delay - time.monotonic()
+                if wait > 0 and not self.closed:
+                    self.condition.wait(wait)
+                    continue
+                data, self.pending = self.pending, None
+            # Anything escaping here would end the thread and every later
+            # save with it, so all errors are kept for the game to look at
+            try:
+                write_save(self.path, data)
+                self.writes += 1
+                self.error = None
+            except Exception as e:
+                if self.error is None:
+                    import logging
+                    logging.getLogger("savefile").error("saving %s failed: %r", self.path, e)
+                self.error = e
@@ -0,0 +1,279 @@
+# Water sort solver
+#
+# A* search over tube states. Colours are mapped to small ints and every
+# state is a tuple of tubes (each a tuple, bottom first). The transposition
+# table is keyed on the sorted tuple of tubes so that permutations of the
+# same board count as a single state.
+
+import heapq
+import time
+
+DEFAULT_CAPACITY = 4
+DEFAULT_NODE_LIMIT = 200000
+
+
+class SolveResult:
+    def __init__(self, moves, expanded, generated, dead_ends, elapsed, optimal, exhausted=False,
+                 path=None, partial_path=None):
+        self.moves = moves          # list of (src, dst) or None if unsolved
+        self.expanded = expanded    # nodes popped from the open list
+        self.generated = generated  # child states produced
+        self.dead_ends = dead_ends  # expanded nodes with no legal move
+        self.elapsed = elapsed
+        self.optimal = optimal
+        self.exhausted = exhausted  # every reachable state searched: unsolvable
+        self.path = path            # canonical states from the start to the goal
+        self.partial_path = partial_path  # towards the most promising node if unsolved
+        self.partial_moves = None
+
+    @property
+    def solved(self):
+        return self.moves is not None
+
+    @property
+    def branching_factor(self):
+        if not self.expanded:
+            return 0.0
+        return self.generated / self.expanded
+
+    @property
+    def dead_end_ratio(self):
+        if not self.expanded:
+            return 0.0
+        return self.dead_ends / self.expanded
+
+    def __repr__(self):
+        length = len(self.moves) if self.moves is not None else None
+        return "SolveResult(moves=%s, expanded=%d, optimal=%s)" % (length, self.expanded, self.optimal)
+
+
+def encode(tubes):
+    # Map arbitrary hashable colours (e.g. RGB tuples) to ints
+    palette = []
+    index = {}
+    state = []
+    for tube in tubes:
+        encoded = []
+        for color in tube:
+            if color not in index:
+                index[color] = len(palette)
+                palette.append(color)
+            encoded.append(index[color])
+        state.append(tuple(encoded))
+    return tuple(state), palette
+
+
+def canonical(state):
+    return tuple(sorted(state))
+
+
+def top_run(tube):
+    top = tube[-1]
+    count = 1
+    for i in range(len(tube) - 2, -1, -1):
+        if tube[i] != top:
+            break
+        count += 1
+    return count
+
+
+def is_solved(state, capacity=DEFAULT_CAPACITY):
+    for tube in state:
+        if not tube:
+            continue
+        if len(tube) != capacity or tube.count(tube[0]) != capacity:
+            return False
+    return True
+
+
+def heuristic(state):
+    # Every run above the bottom of a tube must be poured at least once, and
+    # of all the tubes holding a colour at the bottom only one can stay put.
+    # A single pour touches at most one such run, so this never overestimates.
+    cost = 0
+    bottoms = {}
+    for tube in state:
+        if not tube:
+            continue
+        prev = tube[0]
+        for color in tube:
+            if color != prev:
+                cost += 1
+                prev = color
+        base = tube[0]
+        if base in bottoms:
+            cost += 1
+        else:
+            bottoms[base] = True
+    return cost
+
+
+def legal_moves(state, capacity=DEFAULT_CAPACITY):
+    # Yields (src, dst, amount) with dominated pours pruned:
+    #  - never pour out of a finished tube
+    #  - never pour a single-colour tube into an empty one
+    #  - only try the first empty tube as a destination
+    #  - skip empty destinations when a single-colour tube can take the run
+    #  - merge two single-colour tubes in one direction only
+    n = len(state)
+    first_empty = -1
+    for j in range(n):
+        if not state[j]:
+            first_empty = j
+            break
+
+    for i in range(n):
+        src = state[i]
+        size = len(src)
+        if not size:
+            continue
+        top = src[-1]
+        run = top_run(src)
+        uniform = run == size
+        if uniform and size == capacity:
+            continue
+
+        has_uniform_target = False
+        targets = []
+        for j in range(n):
+            if j == i:
+                continue
+            dst = state[j]
+            dsize = len(dst)
+            if not dsize or dsize == capacity or dst[-1] != top:
+                continue
+            if uniform and top_run(dst) == dsize:
+                if (size, i) > (dsize, j):
+                    continue
+            if top_run(dst) == dsize and run <= capacity - dsize:
+                has_uniform_target = True
+            targets.append(j)
+
+        for j in targets:
+            yield i, j, min(run, capacity - len(state[j]))
+        if first_empty >= 0 and not uniform and not has_uniform_target:
+            yield i, first_empty, run
+
+
+def apply_move(state, src, dst, amount):
+    tubes = list(state)
+    moved = tubes[src][-amount:]
+    tubes[src] = tubes[src][:-amount]
+    tubes[dst] = tubes[dst] + moved
+    return tuple(tubes)
+
+
+def search(state, capacity=DEFAULT_CAPACITY, weight=1.0, node_limit=DEFAULT_NODE_LIMIT,
+           time_limit=None, stop=None, poll_interval=32):
+    # stop is an optional callable polled alongside the deadline; returning
+    # True abandons the search (e.g. when the player moves mid-hint). Both
+    # are checked every poll_interval expansions (a power of two); tight
+    # budgets want 1
+    start = time.perf_counter()
+    deadline = start + time_limit if time_limit is not None else None
+    root = canonical(state)
+    best_g = {root: 0}
+    parent = {root: None}
+    counter = 0
+    # Ties on f are broken towards deeper nodes, which keeps A* from
+    # spreading out across the many equal-cost plateaus of this puzzle
+    open_list = [(weight * heuristic(state), 0, counter, state)]
+    expanded = generated = dead_ends = 0
+    goal = None
+    exhausted = False
+    # Expanded node closest to a solution, for partial answers
+    closest = root
+    closest_rank = (open_list[0][0], 0)
+
+    while open_list:
+        f, neg_g, _, current = heapq.heappop(open_list)
+        g = -neg_g
+        key = canonical(current)
+        if best_g.get(key, g) < g:
+            continue
+        if is_solved(current, capacity):
+            goal = key
+            break
+        expanded += 1
+        if expanded > node_limit:
+            break
+        if not expanded & (poll_interval - 1):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            if stop is not None and stop():
+                break
+        rank = (f - g, neg_g)
+        if rank < closest_rank:
+            closest = key
+            closest_rank = rank
+
+        children = 0
+        for src, dst, amount in legal_moves(current, capacity):
+            child = apply_move(current, src, dst, amount)
+            child_key = canonical(child)
+            children += 1
+            if best_g.get(child_key, g + 2) <= g + 1:
+                continue
+            best_g[child_key] = g + 1
+            parent[child_key] = key
+            counter += 1
+            heapq.heappush(open_list, (g + 1 + weight * heuristic(child), -(g + 1), counter, child))
+        generated += children
+        if not children:
+            dead_ends += 1
+    else:
+        # The open list ran dry without reaching a goal
+        exhausted = True
+
+    result = SolveResult(None, expanded, generated, dead_ends, time.perf_counter() - start,
+                         weight <= 1.0, exhausted)
+    if goal is not None:
+        result.path = _trace(parent, goal)
+    else:
+        result.partial_path = _trace(parent, closest)
+    return result
+
+
+def _trace(parent, key):
+    path = []
+    while key is not None:
+        path.append(key)
+        key = parent[key]
+    path.reverse()
+    return path
+
+
+def replay_path(state, path, capacity=DEFAULT_CAPACITY):
+    # Turn a sequence of canonical states back into moves on the real board
+    moves = []
+    current = state
+    for target in path[1:]:
+        for src, dst, amount in legal_moves(current, capacity):
+            child = apply_move(current, src, dst, amount)
+            if canonical(child) == target:
+                moves.append((src, dst))
+                current = child
+                break
+        else:
+            raise ValueError("path does not follow legal moves")
+    return moves
+
+
+def solve(tubes, capacity=DEFAULT_CAPACITY, weight=1.0, node_limit=DEFAULT_NODE_LIMIT,
+          time_limit=None, stop=None):
+    # tubes is a list of colour lists (bottom first), e.g. [t.colors for t in game.tubes]
+    state, _ = encode(tubes)
+    result = search(state, capacity, weight, node_limit, time_limit, stop)
+    if result.path is not None:
+        result.moves = replay_path(state, result.path, capacity)
+    elif result.partial_path is not None:
+        result.partial_moves = replay_path(state, result.partial_path, capacity)
+    return result
+
+
+def solve_fast(tubes, capacity=DEFAULT_CAPACITY, node_limit=DEFAULT_NODE_LIMIT, time_limit=None,
+               stop=None):
+    # Near-optimal: an inflated heuristic reaches a solution with far fewer
+    # expansions, which is what hints and level validation need on device
+    return solve(tubes, capacity, weight=2.0, node_limit=node_limit, time_limit=time_limit,
+                 stop=stop)
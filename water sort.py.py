@@ -1,23 +1,56 @@
 import pygame
 import sys
-import random
 import os
-import json
+import math
+import threading
+import time
+from collections import OrderedDict, deque
 from pygame.locals import *
 
-# Initialize pygame
-pygame.init()
-pygame.mixer.init()
+from generator import MODES, generate_level, level_seed
+from levelpack import open_pack
+from hints import HintService
+from layout import compute_layout
+from profiler import profiler
+from rules import Puzzle, TubeState
+from savefile import SAVE_VERSION, SaveService
+
+# Only the display (which brings up events) at startup; fonts initialize on
+# first use and the mixer on a background thread once the first frame is up
+pygame.display.init()
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
+# Largest tube size at 800x600; layout.py shrinks tubes to fit bigger boards
+# and scales them up on bigger screens
 TUBE_WIDTH = 60
 TUBE_HEIGHT = 200
-TUBE_CAPACITY = 4
-COLOR_HEIGHT = TUBE_HEIGHT // TUBE_CAPACITY
+# Colour count, tube count and tube capacity per level come from the mode,
+# see generator.MODES
+GAME_MODE = "classic"
 MARGIN = 20
+BOARD_TOP = 100
 FPS = 60
+IDLE_FPS = 10
+IDLE_DELAY = 500  # ms without input or redraws before the loop idles down
+RETAINED_RENDER = True  # redraw only dirty regions instead of the full frame
+TEXT_CACHE_SIZE = 128
+HIT_CELL_SIZE = 100
+ANIMATE_POURS = True
+LIFT_TIME = 0.15  # seconds to lift and tilt a tube, and again to put it back
+POUR_TIME = 0.1  # seconds per segment poured
+LIFT_HEIGHT = 40
+TILT_ANGLE = 70
+TILT_STEPS = 14  # rotated frames per snapshot, rendered on first use
+# Profiler: WS_PROFILE=1 or F3 shows the overlay, WS_TRACE=1 or F4 records a
+# Chrome trace to TRACE_FILE
+PROFILE = os.environ.get("WS_PROFILE") == "1"
+TRACE = os.environ.get("WS_TRACE") == "1"
+TRACE_FILE = "water_sort_trace.json"
+PROFILE_REFRESH = 500  # ms between overlay updates
+PROFILE_ROWS = 6
+PROFILE_POS = (10, SCREEN_HEIGHT - 190)
 
 # Colors
 WHITE = (255, 255, 255)
@@ -28,6 +61,8 @@ TUBE_COLOR = (220, 220, 220)
 BUTTON_COLOR = (100, 150, 200)
 BUTTON_HOVER = (120, 170, 220)
 LOCKED_COLOR = (150, 150, 150)
+STATUS_COLOR = (200, 40, 40)
+HINT_COLOR = (255, 190, 0)
 
 COLORS = [
     (255, 0, 0),    # Red
@@ -43,14 +78,7 @@ COLORS = [
 ]
 
 # Sound effects
-try:
-    POUR_SOUND = pygame.mixer.Sound("pour.wav") if os.path.exists("pour.wav") else None
-    WIN_SOUND = pygame.mixer.Sound("win.wav") if os.path.exists("win.wav") else None
-    CLICK_SOUND = pygame.mixer.Sound("click.wav") if os.path.exists("click.wav") else None
-except:
-    POUR_SOUND = None
-    WIN_SOUND = None
-    CLICK_SOUND = None
+SOUND_FILES = {"pour": "pour.wav", "win": "win.wav", "click": "click.wav"}
 
 # Set up the display
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -58,9 +86,196 @@ pygame.display.set_caption('Water Sort Puzzle')
 clock = pygame.time.Clock()
 
 # Level configuration
-MAX_LEVELS = 50
 LEVELS_PER_PAGE = 12
 SAVE_FILE = "water_sort_save.json"
+PACK_FILE = "levels.pack"
+
+# Precomputed levels, build with: python levelpack.py build levels.pack
+LEVEL_PACK = open_pack(PACK_FILE)
+if LEVEL_PACK and LEVEL_PACK.mode != GAME_MODE:
+    LEVEL_PACK.close()
+    LEVEL_PACK = None
+MAX_LEVELS = len(LEVEL_PACK) if LEVEL_PACK else 50
+# Levels past the pack are generated from a seed derived from the level and
+# this revision, so the same level always gets the same board
+PACK_REVISION = LEVEL_PACK.revision if LEVEL_PACK else 0
+
+class SoundBank:
+    # Opening the audio device and decoding the WAVs is the slowest part of
+    # startup, so it runs on a background thread; play() is a no-op for any
+    # sound that has not loaded (or has no file, or no audio device)
+    def __init__(self, files):
+        self.files = files
+        self.sounds = {}
+        self.loader = None
+    
+    def start(self):
+        if self.loader is None:
+            self.loader = threading.Thread(target=self.load)
+            self.loader.daemon = True
+            self.loader.start()
+    
+    def load(self):
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            return
+        for name, path in self.files.items():
+            if os.path.exists(path):
+                try:
+                    self.sounds[name] = pygame.mixer.Sound(path)
+                except pygame.error:
+                    pass
+    
+    def play(self, name):
+        sound = self.sounds.get(name)
+        if sound is not None:
+            sound.play()
+
+sounds = SoundBank(SOUND_FILES)
+
+class TextCache:
+    # Shared fonts plus an LRU of rendered text surfaces, so static labels
+    # are looked up and rasterized once instead of every frame
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.max_entries = max_entries
+    
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            # The default font, without SysFont's scan of installed fonts
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+    
+    def render(self, text, size, color, antialias=True):
+        key = (text, size, color, antialias)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = self.font(size).render(text, antialias, color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surf
+    
+    def invalidate(self, text, size, color, antialias=True):
+        self.surfaces.pop((text, size, color, antialias), None)
+
+text_cache = TextCache()
+
+def palette_color(index):
+    # The hand-picked COLORS first, then hues spread by the golden angle so
+    # boards with more colours still get distinct ones
+    while len(PALETTE) <= index:
+        n = len(PALETTE) - len(COLORS)
+        color = pygame.Color(0, 0, 0)
+        color.hsva = ((n * 137.508 + 15) % 360, 100 if n % 2 else 60, 90, 100)
+        PALETTE.append((color.r, color.g, color.b))
+    return PALETTE[index]
+
+PALETTE = list(COLORS)
+
+class TubeSprites:
+    # Tube glass, one liquid segment per colour and the selection ring,
+    # rendered once per tube size so that drawing a tube is a handful of
+    # blits whatever the screen resolution
+    def __init__(self, width, segment_height, capacity):
+        self.width = width
+        self.segment_height = segment_height
+        self.capacity = capacity
+        self.height = segment_height * capacity
+        self.glass = None
+        self.highlight = None
+        self.hint_ring = None
+        self.segments = {}
+    
+    def ready(self):
+        if self.glass is None:
+            self.build()
+        return self
+    
+    def build(self):
+        width, height = self.width, self.height
+        bottom = max(6, width // 3)  # depth of the rounded base
+        line = max(1, width // 30)
+        glass = pygame.Surface((width, height), pygame.SRCALPHA)
+        pygame.draw.rect(glass, TUBE_COLOR, (0, 0, width, height - bottom // 2), line)
+        pygame.draw.arc(glass, TUBE_COLOR, (0, height - bottom, width, bottom), 0, 3.14, line)
+        self.glass = glass.convert_alpha()
+        
+        highlight = pygame.Surface((width + 8, height + 8), pygame.SRCALPHA)
+        pygame.draw.rect(highlight, (0, 200, 0), highlight.get_rect(), 3, border_radius=5)
+        self.highlight = highlight.convert_alpha()
+        
+        hint_ring = pygame.Surface((width + 8, height + 8), pygame.SRCALPHA)
+        pygame.draw.rect(hint_ring, HINT_COLOR, hint_ring.get_rect(), 3, border_radius=5)
+        self.hint_ring = hint_ring.convert_alpha()
+        
+        for color in COLORS:
+            self.segment(color)
+    
+    def segment_y(self, i):
+        # Top of segment i (0 at the bottom) relative to the tube
+        return self.height - (i+1)*self.segment_height - 2
+    
+    def tube_surface(self, colors):
+        # Glass and contents on one surface, for the pour animation to rotate
+        surf = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        surf.blit(self.glass, (0, 0))
+        for i, color in enumerate(colors):
+            surf.blit(self.segment(palette_color(color)), (2, self.segment_y(i)))
+        return surf
+    
+    def segment(self, color):
+        surf = self.segments.get(color)
+        if surf is None:
+            # Liquid with a darker rim and a light line along the top
+            surf = pygame.Surface((self.width - 4, self.segment_height))
+            rect = surf.get_rect()
+            darker_color = tuple(max(0, c - 40) for c in color)
+            surf.fill(color)
+            pygame.draw.rect(surf, darker_color, rect, 1)
+            pygame.draw.line(surf, WHITE, (rect.left + 2, rect.top + 2), (rect.right - 2, rect.top + 2), 1)
+            surf = surf.convert()
+            self.segments[color] = surf
+        return surf
+
+sprite_sets = {}
+
+def tube_sprites(board_layout):
+    # One sprite set per tube size, kept for the session: revisiting a board
+    # size reuses the surfaces instead of rendering them again
+    key = (board_layout.tube_width, board_layout.segment_height, board_layout.capacity)
+    sprites = sprite_sets.get(key)
+    if sprites is None:
+        sprites = sprite_sets[key] = TubeSprites(*key)
+    return sprites.ready()
+
+class HitGrid:
+    # Uniform grid over the screen where each cell lists the widgets that
+    # overlap it, so a click only tests the few rects in its own cell
+    def __init__(self, cell_size=HIT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+    
+    def add(self, rect, item):
+        size = self.cell_size
+        for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                self.cells.setdefault((cx, cy), []).append((rect, item))
+    
+    def hit(self, pos):
+        cell = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        for rect, item in self.cells.get(cell, ()):
+            if rect.collidepoint(pos):
+                return item
+        return None
 
 class Button:
     def __init__(self, x, y, width, height, text, action=None, enabled=True):
@@ -69,6 +284,10 @@ class Button:
         self.action = action
         self.hover = False
         self.enabled = enabled
+        self.dirty = True
+    
+    def bounds(self):
+        return self.rect
     
     def draw(self, surface):
         if not self.enabled:
@@ -79,294 +298,624 @@ class Button:
         pygame.draw.rect(surface, color, self.rect, border_radius=10)
         pygame.draw.rect(surface, BLACK, self.rect, 2, border_radius=10)
         
-        font = pygame.font.SysFont(None, 30)
         text_color = BLACK if self.enabled else (100, 100, 100)
-        text_surf = font.render(self.text, True, text_color)
+        text_surf = text_cache.render(self.text, 30, text_color)
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
     
-    def check_hover(self, pos):
-        self.hover = self.rect.collidepoint(pos) and self.enabled
-        return self.hover
+    def set_hover(self, hover):
+        if hover != self.hover:
+            self.hover = hover
+            self.dirty = True
     
     def handle_click(self, pos):
         if self.rect.collidepoint(pos) and self.action and self.enabled:
-            if CLICK_SOUND:
-                CLICK_SOUND.play()
+            sounds.play("click")
             return self.action()
         return None
 
-class Tube:
-    def __init__(self, x, y):
+class Tube(TubeState):
+    def __init__(self, x, y, index, sprites):
+        super().__init__(sprites.capacity)
         self.x = x
         self.y = y
-        self.colors = []
-        self.selected = False
+        self.index = index
+        self.sprites = sprites
+        self.width = sprites.width
+        self.height = sprites.height
+        self.rect = pygame.Rect(x, y, self.width + 1, self.height + 1)
+        self._selected = False
+        self._hinted = False
+        self.dirty = True
     
-    def add_color(self, color):
-        if len(self.colors) < TUBE_CAPACITY:
-            self.colors.append(color)
+    @property
+    def selected(self):
+        return self._selected
     
-    def is_empty(self):
-        return len(self.colors) == 0
+    @selected.setter
+    def selected(self, value):
+        if value != self._selected:
+            self._selected = value
+            self.dirty = True
     
-    def is_full(self):
-        return len(self.colors) == TUBE_CAPACITY
+    @property
+    def hinted(self):
+        return self._hinted
     
-    def is_complete(self):
-        if self.is_empty():
-            return False
-        if len(self.colors) < TUBE_CAPACITY:
-            return False
-        first_color = self.colors[0]
-        return all(color == first_color for color in self.colors)
-    
-    def top_color(self):
-        if self.is_empty():
-            return None
-        return self.colors[-1]
-    
-    def top_color_count(self):
-        if self.is_empty():
-            return 0
-        top_color = self.top_color()
-        count = 0
-        for color in reversed(self.colors):
-            if color == top_color:
-                count += 1
-            else:
-                break
-        return count
+    @hinted.setter
+    def hinted(self, value):
+        if value != self._hinted:
+            self._hinted = value
+            self.dirty = True
     
-    def can_receive(self, color, amount):
-        if self.is_empty():
-            return amount <= TUBE_CAPACITY
-        if self.top_color() != color:
-            return False
-        return len(self.colors) + amount <= TUBE_CAPACITY
+    def bounds(self):
+        # Covers the outline plus the selection highlight
+        return pygame.Rect(self.x - 6, self.y - 6, self.width + 12, self.height + 12)
+    
+    def set_colors(self, colors):
+        super().set_colors(colors)
+        self.dirty = True
+    
+    def add_color(self, color):
+        super().add_color(color)
+        self.dirty = True
+    
+    def move_to(self, other_tube, amount):
+        super().move_to(other_tube, amount)
+        self.dirty = True
     
     def pour_to(self, other_tube):
-        if self.is_empty() or other_tube.is_full():
-            return False
-        
-        top_color = self.top_color()
-        top_count = self.top_color_count()
-        
-        available_space = TUBE_CAPACITY - len(other_tube.colors)
-        pour_amount = min(top_count, available_space)
-        
-        if other_tube.is_empty() or other_tube.top_color() == top_color:
-            for _ in range(pour_amount):
-                other_tube.add_color(self.colors.pop())
-            if POUR_SOUND:
-                POUR_SOUND.play()
-            return True
-        return False
+        poured = super().pour_to(other_tube)
+        if poured:
+            sounds.play("pour")
+        return poured
     
     def draw(self, surface):
-        # Draw tube outline with curved bottom
-        pygame.draw.rect(surface, TUBE_COLOR, (self.x, self.y, TUBE_WIDTH, TUBE_HEIGHT - 10), 2)
-        pygame.draw.arc(surface, TUBE_COLOR, 
-                       (self.x, self.y + TUBE_HEIGHT - 20, TUBE_WIDTH, 20), 
-                       0, 3.14, 2)
+        sprites = self.sprites
         
-        # Draw tube contents with liquid effect
+        # Tube outline with curved bottom, then the liquid segments
+        blits = [(sprites.glass, (self.x, self.y))]
         for i, color in enumerate(self.colors):
-            # Create gradient effect for the liquid
-            darker_color = tuple(max(0, c - 40) for c in color)
-            rect = pygame.Rect(self.x + 2, self.y + TUBE_HEIGHT - (i+1)*COLOR_HEIGHT - 2, 
-                             TUBE_WIDTH - 4, COLOR_HEIGHT)
-            
-            pygame.draw.rect(surface, color, rect)
-            pygame.draw.rect(surface, darker_color, rect, 1)
-            pygame.draw.line(surface, (255, 255, 255, 100), 
-                           (rect.left + 2, rect.top + 2), 
-                           (rect.right - 2, rect.top + 2), 1)
+            y = self.y + sprites.segment_y(i)
+            blits.append((sprites.segment(palette_color(color)), (self.x + 2, y)))
         
-        # Draw selection highlight
+        # Hint and selection highlights
+        if self.hinted:
+            blits.append((sprites.hint_ring, (self.x - 4, self.y - 4)))
         if self.selected:
-            pygame.draw.rect(surface, (0, 200, 0), 
-                           (self.x - 4, self.y - 4, TUBE_WIDTH + 8, TUBE_HEIGHT + 8), 
-                           3, border_radius=5)
+            blits.append((sprites.highlight, (self.x - 4, self.y - 4)))
+        
+        surface.blits(blits, False)
+
+def ease(t):
+    return t * t * (3 - 2 * t)
+
+class PourAnimation:
+    # The board has already changed when this starts; it only shows the
+    # source lifting, tilting over the target and pouring, then going back.
+    # Time comes from clock.tick, so a dropped frame skips ahead rather than
+    # slowing the pour down. The source is drawn from two snapshots (before
+    # and after the pour) rotated in TILT_STEPS steps and reused, so a frame
+    # is a few blits like a static one.
+    def __init__(self, source, target, amount):
+        self.source = source
+        self.target = target
+        self.amount = amount
+        self.color = palette_color(target.colors[-1])
+        self.elapsed = 0.0
+        self.started = False
+        self.pour_time = POUR_TIME * amount
+        self.duration = 2 * LIFT_TIME + self.pour_time
+        self.side = 1 if target.x >= source.x else -1
+        
+        sprites = source.sprites
+        self.snapshots = {
+            'before': sprites.tube_surface(source.colors + target.colors[-amount:]),
+            'after': sprites.tube_surface(source.colors)
+        }
+        self.frames = {}
+        width, height = source.width, source.height
+        self.home = (source.x + width / 2, source.y + height / 2)
+        self.mouth = (target.x + width // 2 - self.side * width // 4, target.y - 10)
+        angle = math.radians(TILT_ANGLE)
+        self.pour_center = (self.mouth[0] - self.side * math.sin(angle) * height / 2,
+                            self.mouth[1] + math.cos(angle) * height / 2)
+        self.region = self.bounds()
+    
+    def bounds(self):
+        # Everything the animation can touch, repainted each frame
+        tilted = self.frame('after', TILT_STEPS)
+        rect = tilted.get_rect(center=self.pour_center)
+        rect.union_ip(self.source.bounds())
+        rect.union_ip(self.target.bounds())
+        rect.inflate_ip(20, 20)
+        rect.top -= LIFT_HEIGHT
+        rect.height += LIFT_HEIGHT
+        return rect.clip(screen.get_rect())
+    
+    def frame(self, snapshot, step):
+        key = (snapshot, step)
+        image = self.frames.get(key)
+        if image is None:
+            angle = -self.side * TILT_ANGLE * step / TILT_STEPS
+            image = pygame.transform.rotate(self.snapshots[snapshot], angle)
+            self.frames[key] = image
+        return image
+    
+    def advance(self, dt):
+        # dt in ms; True once the animation has finished. The first frame
+        # does not advance, its dt covers time before the pour was made
+        if self.started:
+            self.elapsed += dt / 1000.0
+        self.started = True
+        return self.elapsed >= self.duration
+    
+    def pose(self):
+        # (center, tilt 0-1, snapshot, fraction of the pour in the target)
+        t = self.elapsed
+        if t < LIFT_TIME:
+            move = ease(t / LIFT_TIME)
+            return self.travel(move), move, 'before', 0.0
+        t -= LIFT_TIME
+        if t < self.pour_time:
+            return self.pour_center, 1.0, 'after', t / self.pour_time
+        move = ease(min(1.0, (t - self.pour_time) / LIFT_TIME))
+        return self.travel(1.0 - move), 1.0 - move, 'after', 1.0
+    
+    def travel(self, t):
+        # From home to the pour position along an arc over the other tubes
+        (hx, hy), (px, py) = self.home, self.pour_center
+        return (hx + (px - hx) * t, hy + (py - hy) * t - LIFT_HEIGHT * 4 * t * (1 - t))
+    
+    def draw(self, surface):
+        center, tilt, snapshot, fill = self.pose()
+        top = self.draw_target(surface, fill)
+        if 0.0 < fill < 1.0:
+            x, y = self.mouth
+            pygame.draw.rect(surface, self.color, (x - 3, y, 6, top - y))
+        image = self.frame(snapshot, int(round(tilt * TILT_STEPS)))
+        surface.blit(image, image.get_rect(center=(int(center[0]), int(center[1]))))
+    
+    def draw_target(self, surface, fill):
+        # Target tube with the new segments rising from below; returns the
+        # height of the liquid surface
+        target = self.target
+        sprites = target.sprites
+        step = sprites.segment_height
+        settled = len(target.colors) - self.amount
+        top = target.y + sprites.segment_y(settled - 1)
+        surface_y = top - int(self.amount * step * fill)
+        blits = [(sprites.glass, (target.x, target.y))]
+        for i, color in enumerate(target.colors):
+            y = target.y + sprites.segment_y(i)
+            segment = sprites.segment(palette_color(color))
+            if i < settled:
+                blits.append((segment, (target.x + 2, y)))
+            elif y + step > surface_y:
+                clip = max(0, surface_y - y)
+                blits.append((segment, (target.x + 2, y + clip),
+                              pygame.Rect(0, clip, sprites.width - 4, step - clip)))
+        surface.blits(blits, False)
+        return surface_y
+
+class LevelLoader:
+    # Generates a level on a worker thread, since scoring candidates with the
+    # solver can take seconds on a phone; the game shows a loading screen
+    # and polls done() each frame. cancel() makes the solver stop at its next
+    # poll so an abandoned load does not keep competing with the main loop
+    def __init__(self, level, seed, mode):
+        self.level = level
+        self.seed = seed
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.finished = threading.Event()
+        worker = threading.Thread(target=self.work, args=(mode,))
+        worker.daemon = True
+        worker.start()
+    
+    def work(self, mode):
+        try:
+            self.result = generate_level(self.level, self.seed, mode=mode,
+                                         stop=lambda: self.cancelled)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished.set()
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def done(self):
+        return self.finished.is_set()
 
 class Game:
     def __init__(self):
         self.level = 1
         self.max_unlocked = 1
-        self.moves = 0
-        self.game_state = "menu"  # menu, playing, win, level_select
+        self.puzzle = None
+        self.game_state = "menu"  # menu, loading, playing, level_complete, level_select
         self.selected_tube = None
-        self.history = []
         self.level_page = 0
+        self.tubes = []
+        self.full_redraw = True
+        self.drawn_view = None
+        self.drawn_moves = None
+        self.status_message = None
+        self.drawn_status = None
+        self.mode = MODES[GAME_MODE]
+        self.hints = HintService(self.mode.capacity)
+        self.hint_tubes = ()
+        self.hint_waiting = False
+        self.level_tubes = None
+        self.seed = None
+        self.level_started = 0
+        self.time_before = 0.0  # seconds played on this level before a resume
+        self.best = {}  # level -> {"moves": n, "time": seconds}
+        self.current = None  # in-progress board from the save, if any
+        self.animation = None
+        self.redraw_region = None  # area to repaint once an animation ends
+        self.queued_clicks = deque()
+        self.loader = None  # level being generated in the background
+        self.load_error = None
+        self.pointer = None  # last hover position, None once a finger lifts
+        self.hovered = None
+        self.saver = SaveService(SAVE_FILE)
+        self.save_failed = False
         self.load_game()
         
         # Menu buttons
         self.buttons = [
-            Button(SCREEN_WIDTH//2 - 100, 200, 200, 50, "Play", self.show_level_select),
+            Button(SCREEN_WIDTH//2 - 100, 200, 200, 50, "Play", self.play),
             Button(SCREEN_WIDTH//2 - 100, 270, 200, 50, "Level Select", self.show_level_select),
             Button(SCREEN_WIDTH//2 - 100, 340, 200, 50, "Quit", self.quit_game)
         ]
+        
+        # Playing screen buttons
+        self.undo_btn = Button(SCREEN_WIDTH - 120, 20, 100, 40, "Undo", self.undo)
+        self.redo_btn = Button(SCREEN_WIDTH - 230, 20, 100, 40, "Redo", self.redo)
+        self.hint_btn = Button(SCREEN_WIDTH - 230, 70, 100, 40, "Hint", self.request_hint)
+        self.menu_btn = Button(SCREEN_WIDTH - 120, 70, 100, 40, "Menu", self.show_menu)
+        # Loading screen
+        self.loading_back_btn = Button(SCREEN_WIDTH // 2 - 60, 370, 120, 50, "Back",
+                                       self.show_level_select)
+        self.win_buttons = []
+        self.build_layout()
+    
+    @property
+    def moves(self):
+        return self.puzzle.moves if self.puzzle else 0
     
     def load_game(self):
-        try:
-            if os.path.exists(SAVE_FILE):
-                with open(SAVE_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.max_unlocked = data.get('max_unlocked', 1)
-                    # Ensure we don't exceed our MAX_LEVELS
-                    if self.max_unlocked > MAX_LEVELS:
-                        self.max_unlocked = MAX_LEVELS
-        except:
-            self.max_unlocked = 1
+        # A missing or unreadable save comes back empty, so this starts fresh
+        data = self.saver.load()
+        max_unlocked = data.get('max_unlocked', 1)
+        if not isinstance(max_unlocked, int) or max_unlocked < 1:
+            max_unlocked = 1
+        # Ensure we don't exceed our MAX_LEVELS
+        self.max_unlocked = min(max_unlocked, MAX_LEVELS)
+        levels = data.get('levels')
+        if isinstance(levels, dict):
+            for level, best in levels.items():
+                if level.isdigit() and isinstance(best, dict):
+                    self.best[int(level)] = best
+        current = data.get('current')
+        if isinstance(current, dict) and current.get('level') in range(1, self.max_unlocked + 1):
+            self.current = current
     
     def save_game(self):
+        # Snapshot on the main thread; the save service does the writing.
+        # Nested dicts are copied too, since record_win keeps updating them
+        # while the worker may be serializing this one
         data = {
-            'max_unlocked': min(self.max_unlocked, MAX_LEVELS)
+            'version': SAVE_VERSION,
+            'max_unlocked': min(self.max_unlocked, MAX_LEVELS),
+            'levels': dict((str(level), dict(best)) for level, best in self.best.items()),
+            'current': dict(self.current) if self.current is not None else None
         }
-        with open(SAVE_FILE, 'w') as f:
-            json.dump(data, f)
+        self.saver.save(data)
     
-    def setup_level(self, level):
-        self.tubes = []
-        self.moves = 0
-        self.history = []
+    def play_time(self):
+        return self.time_before + time.monotonic() - self.level_started
+    
+    def save_progress(self):
+        self.current = {
+            'level': self.level,
+            'seed': self.seed,
+            'capacity': self.puzzle.capacity,
+            'tubes': self.level_tubes,
+            'moves': self.puzzle.history.moves(),
+            'time': round(self.play_time(), 1)
+        }
+        self.save_game()
+    
+    def record_win(self):
+        best = self.best.get(self.level)
+        moves, seconds = self.moves, round(self.play_time(), 1)
+        if best is None:
+            best = self.best[self.level] = {'time': seconds}
+        best['time'] = min(best.get('time', seconds), seconds)
+        if moves < best.get('moves', moves + 1):
+            best['moves'] = moves
+            # Keep the replay behind each best score so it can be verified
+            if self.seed is not None:
+                best['replay'] = self.replay().encode()
+            else:
+                best.pop('replay', None)
+        self.current = None
+        self.save_game()
+    
+    def replay(self):
+        from replay import Replay  # only needed once a level is won
+        return Replay(self.level, self.seed, self.puzzle.history.moves(), self.puzzle.capacity,
+                      PACK_REVISION, self.mode.name)
+    
+    def play(self):
+        # Pick up the board left unfinished last time, if there is one
+        if self.current is not None:
+            self.resume_level(self.current)
+        else:
+            self.show_level_select()
+    
+    def resume_level(self, current):
+        try:
+            self.setup_level(current['level'], seed=current.get('seed'), tubes=current['tubes'],
+                             capacity=current.get('capacity'))
+            for src, dst in current['moves']:
+                if not self.puzzle.pour(src, dst):
+                    raise ValueError("saved move %d -> %d is not legal" % (src, dst))
+        except (KeyError, TypeError, ValueError, IndexError, OverflowError):
+            self.current = None
+            self.show_level_select()
+            return
+        self.time_before = current.get('time', 0.0)
+        if self.puzzle.check_win():
+            self.setup_level(self.level)
+        else:
+            self.check_stuck()
+    
+    def setup_level(self, level, from_pack=True, seed=None, tubes=None, capacity=None):
+        self.clear_hint()
+        self.stop_animation()
         self.selected_tube = None
-        self.game_state = "playing"
+        self.status_message = None
+        self.cancel_loading()
         self.level = level
+        self.full_redraw = True
         
-        # Dynamic difficulty progression
-        base_colors = 4
-        color_increase = (level - 1) // 5  # Increase colors every 5 levels
-        num_colors = min(base_colors + color_increase, len(COLORS))
-        
-        base_tubes = num_colors + 2
-        tube_increase = (level - 1) // 3  # Increase tubes every 3 levels
-        num_tubes = min(base_tubes + tube_increase, 12)  # Max 12 tubes
-        
-        # Calculate tube positions
-        tubes_per_row = min(num_tubes, 8)
-        start_x = (SCREEN_WIDTH - tubes_per_row * (TUBE_WIDTH + MARGIN)) // 2
+        if tubes is not None:
+            capacity = capacity or self.mode.level_params(level)[2]
+            self.start_board(seed, tubes, capacity)
+        elif seed is None and from_pack and LEVEL_PACK and level <= len(LEVEL_PACK):
+            entry = LEVEL_PACK.level(level)
+            self.start_board(entry.seed, entry.tubes, entry.capacity)
+        else:
+            # Solvable board scored into this level's difficulty band, found
+            # off the main thread; update() starts it once ready
+            if seed is None:
+                seed = level_seed(level, base_seed=PACK_REVISION)
+            self.loader = LevelLoader(level, seed, self.mode)
+            self.game_state = "loading"
+            self.build_layout()
+    
+    def cancel_loading(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+        self.load_error = None
+    
+    def update_loader(self):
+        loader = self.loader
+        if loader is None:
+            return False
+        if not loader.done():
+            return True
+        self.loader = None
+        if loader.result is None:
+            # Stays on the loading screen with the error and its Back button
+            import logging
+            logging.getLogger("water_sort").error("generating level %d (seed %d) failed: %r", loader.level, loader.seed,
+                      loader.error)
+            self.load_error = "Couldn't generate level %d" % loader.level
+            self.full_redraw = True
+        else:
+            self.full_redraw = True
+            self.start_board(loader.seed, loader.result.tubes, loader.result.capacity)
+        return True
+    
+    def start_board(self, seed, level_tubes, capacity):
+        self.game_state = "playing"
+        self.seed = seed
+        if self.hints.capacity != capacity:
+            self.hints = HintService(capacity)
+        num_tubes = len(level_tubes)
+        self.level_tubes = [list(colors) for colors in level_tubes]
+        self.level_started = time.monotonic()
+        self.time_before = 0.0
         
-        for i in range(num_tubes):
-            row = i // 8
-            col = i % 8
-            x = start_x + col * (TUBE_WIDTH + MARGIN)
-            y = 100 + row * (TUBE_HEIGHT + MARGIN)
-            self.tubes.append(Tube(x, y))
+        # Tube positions and sizes for this screen and board, cached by both
+        width, height = screen.get_size()
+        board_layout = compute_layout(width, height, num_tubes, capacity, BOARD_TOP, MARGIN,
+                                      TUBE_WIDTH, TUBE_HEIGHT / TUBE_WIDTH)
+        sprites = tube_sprites(board_layout)
+        positions = board_layout.positions
         
         # Fill tubes with colors
-        color_pool = []
-        colors_to_use = random.sample(COLORS, num_colors)
-        for color in colors_to_use:
-            color_pool.extend([color] * TUBE_CAPACITY)
-        
-        random.shuffle(color_pool)
-        
-        # Distribute colors to tubes (leave some empty)
-        tubes_to_fill = num_tubes - 2  # Leave 2 empty tubes
-        for i in range(tubes_to_fill):
-            for _ in range(TUBE_CAPACITY):
-                if color_pool:
-                    self.tubes[i].add_color(color_pool.pop())
-    
-    def save_state(self):
-        state = []
-        for tube in self.tubes:
-            state.append(list(tube.colors))
-        self.history.append((state, self.moves))
-        if len(self.history) > 10:
-            self.history.pop(0)
+        self.puzzle = Puzzle(level_tubes, capacity,
+                             lambda i: Tube(positions[i][0], positions[i][1], i, sprites))
+        self.tubes = self.puzzle.tubes
+        self.build_layout()
     
     def undo(self):
-        if self.history and self.game_state == "playing":
-            state, moves = self.history.pop()
-            for i, tube in enumerate(self.tubes):
-                tube.colors = list(state[i])
-                tube.selected = False
-            self.moves = moves
-            self.selected_tube = None
+        if self.game_state == "playing" and self.puzzle.undo():
+            self.clear_hint()
+            self.clear_selection()
+            self.check_stuck()
+            self.save_progress()
             return True
         return False
     
-    def handle_click(self, pos):
-        if self.game_state == "menu":
-            for button in self.buttons:
-                result = button.handle_click(pos)
-                if result is not None:
-                    return
-        elif self.game_state == "level_select":
-            for button in self.level_buttons:
-                result = button.handle_click(pos)
-                if result is not None:
-                    return
-            
-            # Handle page navigation
-            if self.prev_page_btn.check_hover(pos) and pygame.mouse.get_pressed()[0]:
-                self.prev_page_btn.handle_click(pos)
-            if self.next_page_btn.check_hover(pos) and pygame.mouse.get_pressed()[0]:
-                self.next_page_btn.handle_click(pos)
-            
-            # Back button
-            if self.back_btn.check_hover(pos) and pygame.mouse.get_pressed()[0]:
-                self.back_btn.handle_click(pos)
-        elif self.game_state == "playing":
-            for tube in self.tubes:
-                if (tube.x <= pos[0] <= tube.x + TUBE_WIDTH and 
-                    tube.y <= pos[1] <= tube.y + TUBE_HEIGHT):
-                    
-                    if self.selected_tube is None:
-                        if not tube.is_empty():
-                            self.save_state()
-                            tube.selected = True
-                            self.selected_tube = tube
-                    else:
-                        if tube == self.selected_tube:
-                            tube.selected = False
-                            self.selected_tube = None
-                            self.history.pop()
-                        else:
-                            if self.selected_tube.pour_to(tube):
-                                self.moves += 1
-                                self.selected_tube.selected = False
-                                self.selected_tube = None
-                                
-                                if self.check_win():
-                                    self.game_state = "level_complete"
-                                    if self.level == self.max_unlocked and self.level < MAX_LEVELS:
-                                        self.max_unlocked += 1
-                                        self.save_game()
-                                    if WIN_SOUND:
-                                        WIN_SOUND.play()
-                            else:
-                                self.selected_tube.selected = False
-                                if not tube.is_empty():
-                                    self.save_state()
-                                    tube.selected = True
-                                    self.selected_tube = tube
-                                else:
-                                    self.selected_tube = None
-                                    self.history.pop()
-                    break
-            
-            # Check buttons
-            mouse_pos = pygame.mouse.get_pos()
-            if self.undo_btn.check_hover(mouse_pos) and pygame.mouse.get_pressed()[0]:
-                self.undo_btn.handle_click(mouse_pos)
-            if self.menu_btn.check_hover(mouse_pos) and pygame.mouse.get_pressed()[0]:
-                self.menu_btn.handle_click(mouse_pos)
-        elif self.game_state == "level_complete":
-            for button in self.win_buttons:
-                result = button.handle_click(pos)
-                if result is not None:
-                    return
+    def redo(self):
+        if self.game_state == "playing" and self.puzzle.redo():
+            self.clear_hint()
+            self.clear_selection()
+            self.check_stuck()
+            self.save_progress()
+            return True
+        return False
     
-    def check_win(self):
-        for tube in self.tubes:
-            if not tube.is_empty() and not tube.is_complete():
-                return False
+    def check_stuck(self):
+        # Legal-move scan first, then a lookahead capped at a few ms so the
+        # frame never stalls; an inconclusive lookahead shows nothing
+        if not self.puzzle.legal_moves():
+            self.status_message = "No moves left - tap Undo"
+        elif self.puzzle.solvable() is False:
+            self.status_message = "Can't be solved from here - tap Undo"
+        else:
+            self.status_message = None
+    
+    def request_hint(self):
+        if self.game_state != "playing":
+            return
+        self.clear_hint()
+        hint = self.hints.request([tube.colors for tube in self.tubes])
+        if hint is not None:
+            self.show_hint(hint)
+        else:
+            self.hint_waiting = True
+            self.status_message = "Thinking..."
+    
+    def show_hint(self, hint):
+        src, dst = hint.move
+        self.hint_tubes = (self.tubes[src], self.tubes[dst])
+        for tube in self.hint_tubes:
+            tube.hinted = True
+        self.status_message = "Best guess so far" if hint.partial else None
+    
+    def clear_hint(self):
+        # Cancels any search in flight; called whenever the board changes
+        self.hints.cancel()
+        for tube in self.hint_tubes:
+            tube.hinted = False
+        self.hint_tubes = ()
+        if self.hint_waiting:
+            self.hint_waiting = False
+            self.status_message = None
+    
+    def update(self, dt):
+        # Per-frame work not driven by input, dt being the last frame time in
+        # ms; True while something is pending
+        self.check_save_error()
+        busy = self.update_loader() or self.update_animation(dt)
+        if not self.hint_waiting:
+            return busy
+        done, hint = self.hints.poll()
+        if not done:
+            return True
+        self.hint_waiting = False
+        if hint is not None:
+            self.show_hint(hint)
+        else:
+            self.status_message = "No hint found - try Undo"
+        return busy
+    
+    def check_save_error(self):
+        # Tells the player once when saving starts failing (disk full,
+        # read-only storage); the service keeps retrying with each save
+        failed = self.saver.error is not None
+        if failed != self.save_failed:
+            self.save_failed = failed
+            if failed:
+                self.status_message = "Couldn't save progress"
+    
+    def update_animation(self, dt):
+        if self.animation is None:
+            return False
+        if self.animation.advance(dt):
+            self.redraw_region = self.animation.region
+            self.animation = None
+            self.finish_pour()
+            # Clicks made during the pour, until one starts another pour;
+            # the rest wait for that one to finish
+            while self.queued_clicks and self.animation is None and self.game_state == "playing":
+                self.handle_click(self.queued_clicks.popleft())
+            if self.game_state != "playing":
+                self.queued_clicks.clear()
         return True
     
+    def stop_animation(self):
+        if self.animation is not None:
+            self.redraw_region = self.animation.region
+            self.animation = None
+        self.queued_clicks.clear()
+    
+    def clear_selection(self):
+        if self.selected_tube is not None:
+            self.selected_tube.selected = False
+            self.selected_tube = None
+    
+    def build_layout(self):
+        # Called once per screen transition; hit-testing and hover reuse it
+        # until the next one
+        self.layout = HitGrid()
+        for widget in self.widgets():
+            self.layout.add(widget.rect, widget)
+        # Buttons are reused between screens, so drop the old hover first
+        if self.hovered is not None:
+            self.hovered.set_hover(False)
+            self.hovered = None
+        self.update_hover(self.pointer)
+    
+    def handle_click(self, pos):
+        if self.animation is not None:
+            # Every click is kept, however many pours they add up to; they
+            # replay in order as each pour finishes
+            self.queued_clicks.append(pos)
+            return
+        target = self.layout.hit(pos)
+        if isinstance(target, Tube):
+            self.click_tube(target)
+        elif target is not None:
+            target.handle_click(pos)
+    
+    def click_tube(self, tube):
+        if self.selected_tube is None:
+            if not tube.is_empty():
+                tube.selected = True
+                self.selected_tube = tube
+        elif tube == self.selected_tube:
+            tube.selected = False
+            self.selected_tube = None
+        else:
+            source = self.selected_tube
+            source.selected = False
+            amount = self.puzzle.pour(source.index, tube.index)
+            if amount:
+                self.selected_tube = None
+                self.clear_hint()
+                if ANIMATE_POURS:
+                    self.animation = PourAnimation(source, tube, amount)
+                else:
+                    self.finish_pour()
+            elif not tube.is_empty():
+                tube.selected = True
+                self.selected_tube = tube
+            else:
+                self.selected_tube = None
+    
+    def finish_pour(self):
+        if self.puzzle.check_win():
+            if self.level == self.max_unlocked and self.level < MAX_LEVELS:
+                self.max_unlocked += 1
+            self.record_win()
+            self.show_level_complete()
+            sounds.play("win")
+        else:
+            self.check_stuck()
+            self.save_progress()
+    
     def show_level_select(self):
+        self.cancel_loading()
         self.game_state = "level_select"
         self.level_page = 0
         self.update_level_buttons()
@@ -401,6 +950,7 @@ class Game:
         self.next_page_btn = Button(SCREEN_WIDTH - 170, SCREEN_HEIGHT - 70, 120, 50, "Next", 
                                    lambda: self.change_page(1), (self.level_page + 1) * LEVELS_PER_PAGE < MAX_LEVELS)
         self.back_btn = Button(SCREEN_WIDTH // 2 - 60, SCREEN_HEIGHT - 70, 120, 50, "Back", self.show_menu)
+        self.build_layout()
     
     def change_page(self, delta):
         new_page = self.level_page + delta
@@ -419,17 +969,110 @@ class Game:
             self.show_menu()
     
     def show_menu(self):
+        self.clear_hint()
+        self.stop_animation()
+        self.cancel_loading()
         self.game_state = "menu"
+        self.build_layout()
+    
+    def show_level_complete(self):
+        self.game_state = "level_complete"
+        next_enabled = self.level < self.max_unlocked
+        self.win_buttons = [
+            Button(SCREEN_WIDTH//2 - 220, 350, 200, 50, "Next Level", self.next_level, next_enabled),
+            Button(SCREEN_WIDTH//2 + 20, 350, 200, 50, "Main Menu", self.show_menu)
+        ]
+        self.build_layout()
     
     def quit_game(self):
+        self.saver.close()
+        finish_trace()
         pygame.quit()
         sys.exit()
     
+    def screen_buttons(self):
+        if self.game_state == "menu":
+            return self.buttons
+        elif self.game_state == "loading":
+            return [self.loading_back_btn]
+        elif self.game_state == "playing":
+            return [self.undo_btn, self.redo_btn, self.hint_btn, self.menu_btn]
+        elif self.game_state == "level_complete":
+            return self.win_buttons
+        elif self.game_state == "level_select":
+            return self.level_buttons + [self.prev_page_btn, self.next_page_btn, self.back_btn]
+        return []
+    
+    def widgets(self):
+        if self.game_state == "playing":
+            return self.tubes + self.screen_buttons()
+        return self.screen_buttons()
+    
+    def update_hover(self, pos):
+        # Only the button under the pointer and the one it just left can
+        # change, so nothing is marked dirty while moving within either
+        self.pointer = pos
+        target = self.layout.hit(pos) if pos is not None else None
+        if not isinstance(target, Button) or not target.enabled:
+            target = None
+        if target is not self.hovered:
+            if self.hovered is not None:
+                self.hovered.set_hover(False)
+            if target is not None:
+                target.set_hover(True)
+            self.hovered = target
+    
     def draw(self, surface):
+        # Returns True when anything was pushed to the display
+        view = (self.game_state, self.level_page, self.level)
+        if not RETAINED_RENDER or self.full_redraw or view != self.drawn_view:
+            self.draw_full(surface)
+            self.drawn_view = view
+            return True
+        
+        widgets = self.widgets()
+        if self.game_state == "level_complete":
+            # Buttons sit on a translucent overlay, so repaint the whole frame
+            if any(widget.dirty for widget in widgets):
+                self.draw_full(surface)
+                return True
+            return False
+        
+        rects = []
+        animated = (self.animation.source, self.animation.target) if self.animation else ()
+        for widget in widgets:
+            if widget.dirty and widget not in animated:
+                rect = widget.bounds()
+                surface.fill(LIGHT_GRAY, rect)
+                widget.draw(surface)
+                widget.dirty = False
+                rects.append(rect)
+        if self.game_state == "playing" and self.moves != self.drawn_moves:
+            rects.append(self.draw_moves(surface))
+        if self.game_state == "playing" and self.status_message != self.drawn_status:
+            rects.append(self.draw_status(surface))
+        
+        # Repaint the whole area under a pour animation, clipped to it
+        region = self.animation.region if self.animation else self.redraw_region
+        if region is not None and self.game_state == "playing":
+            surface.set_clip(region)
+            surface.fill(LIGHT_GRAY, region)
+            self.draw_game(surface)
+            surface.set_clip(None)
+            rects.append(region)
+        self.redraw_region = None
+        
+        if rects:
+            pygame.display.update(rects)
+        return bool(rects)
+    
+    def draw_full(self, surface):
         surface.fill(LIGHT_GRAY)
         
         if self.game_state == "menu":
             self.draw_menu(surface)
+        elif self.game_state == "loading":
+            self.draw_loading(surface)
         elif self.game_state == "playing":
             self.draw_game(surface)
         elif self.game_state == "level_complete":
@@ -438,40 +1081,70 @@ class Game:
             self.draw_level_select(surface)
         
         pygame.display.flip()
+        self.full_redraw = False
+        for widget in self.widgets():
+            widget.dirty = False
     
     def draw_menu(self, surface):
         # Title
-        font = pygame.font.SysFont(None, 72)
-        title = font.render("Water Sort Puzzle", True, BLACK)
+        title = text_cache.render("Water Sort Puzzle", 72, BLACK)
         surface.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
         
         # Buttons
         for button in self.buttons:
             button.draw(surface)
     
+    def draw_loading(self, surface):
+        text = text_cache.render(f"Level {self.level}", 48, BLACK)
+        surface.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 220))
+        if self.load_error is None:
+            text = text_cache.render("Generating...", 36, BLACK)
+        else:
+            text = text_cache.render(self.load_error, 36, STATUS_COLOR)
+        surface.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 290))
+        self.loading_back_btn.draw(surface)
+    
     def draw_game(self, surface):
         # Level and moves info
-        font = pygame.font.SysFont(None, 36)
-        level_text = font.render(f"Level: {self.level}", True, BLACK)
-        moves_text = font.render(f"Moves: {self.moves}", True, BLACK)
+        level_text = text_cache.render(f"Level: {self.level}", 36, BLACK)
         surface.blit(level_text, (20, 20))
-        surface.blit(moves_text, (20, 60))
+        self.draw_moves(surface)
+        self.draw_status(surface)
         
-        # Tubes
+        # Tubes, with the two in a pour drawn by the animation on top
+        animated = (self.animation.source, self.animation.target) if self.animation else ()
         for tube in self.tubes:
-            tube.draw(surface)
+            if tube not in animated:
+                tube.draw(surface)
+        if self.animation:
+            self.animation.draw(surface)
         
         # Buttons
-        self.undo_btn = Button(SCREEN_WIDTH - 120, 20, 100, 40, "Undo", self.undo)
-        self.menu_btn = Button(SCREEN_WIDTH - 120, 70, 100, 40, "Menu", self.show_menu)
-        
-        mouse_pos = pygame.mouse.get_pos()
-        self.undo_btn.check_hover(mouse_pos)
-        self.menu_btn.check_hover(mouse_pos)
-        
         self.undo_btn.draw(surface)
+        self.redo_btn.draw(surface)
+        self.hint_btn.draw(surface)
         self.menu_btn.draw(surface)
     
+    def draw_moves(self, surface):
+        rect = pygame.Rect(20, 60, 200, 30)
+        surface.fill(LIGHT_GRAY, rect)
+        if self.drawn_moves is not None and self.drawn_moves != self.moves:
+            # The old count will not be shown again until it is reached anew
+            text_cache.invalidate(f"Moves: {self.drawn_moves}", 36, BLACK)
+        moves_text = text_cache.render(f"Moves: {self.moves}", 36, BLACK)
+        surface.blit(moves_text, rect.topleft)
+        self.drawn_moves = self.moves
+        return rect
+    
+    def draw_status(self, surface):
+        rect = pygame.Rect(230, 25, 330, 30)
+        surface.fill(LIGHT_GRAY, rect)
+        if self.status_message:
+            text = text_cache.render(self.status_message, 28, STATUS_COLOR)
+            surface.blit(text, text.get_rect(center=rect.center))
+        self.drawn_status = self.status_message
+        return rect
+    
     def draw_level_complete(self, surface):
         # Transparent overlay
         s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
@@ -479,35 +1152,24 @@ class Game:
         surface.blit(s, (0, 0))
         
         # Win message
-        font = pygame.font.SysFont(None, 72)
-        win_text = font.render("Level Complete!", True, WHITE)
+        win_text = text_cache.render("Level Complete!", 72, WHITE)
         surface.blit(win_text, (SCREEN_WIDTH // 2 - win_text.get_width() // 2, 150))
         
         # Stats
-        font = pygame.font.SysFont(None, 48)
-        stats_text = font.render(f"Moves: {self.moves}", True, WHITE)
+        stats_text = text_cache.render(f"Moves: {self.moves}", 48, WHITE)
         surface.blit(stats_text, (SCREEN_WIDTH // 2 - stats_text.get_width() // 2, 250))
         
         # Buttons
-        next_enabled = self.level < self.max_unlocked
-        self.win_buttons = [
-            Button(SCREEN_WIDTH//2 - 220, 350, 200, 50, "Next Level", self.next_level, next_enabled),
-            Button(SCREEN_WIDTH//2 + 20, 350, 200, 50, "Main Menu", self.show_menu)
-        ]
-        
-        mouse_pos = pygame.mouse.get_pos()
         for button in self.win_buttons:
-            button.check_hover(mouse_pos)
             button.draw(surface)
     
     def draw_level_select(self, surface):
         # Title
-        font = pygame.font.SysFont(None, 48)
-        title = font.render("Select Level", True, BLACK)
+        title = text_cache.render("Select Level", 48, BLACK)
         surface.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 50))
         
         # Page info
-        page_text = font.render(f"Page {self.level_page + 1}/{(MAX_LEVELS - 1) // LEVELS_PER_PAGE + 1}", True, BLACK)
+        page_text = text_cache.render(f"Page {self.level_page + 1}/{(MAX_LEVELS - 1) // LEVELS_PER_PAGE + 1}", 48, BLACK)
         surface.blit(page_text, (SCREEN_WIDTH // 2 - page_text.get_width() // 2, 100))
         
         # Level buttons
@@ -519,33 +1181,158 @@ class Game:
         self.next_page_btn.draw(surface)
         self.back_btn.draw(surface)
 
-def main():
-    game = Game()
+# Timed only while the profiler is enabled
+profiler.register(Tube, "draw")
+profiler.register(PourAnimation, "draw")
+profiler.register(Game, "handle_click", "update_hover", "draw", "draw_full", "draw_menu", "draw_loading", "draw_game", "draw_moves",
+                  "draw_status", "draw_level_complete", "draw_level_select")
+
+class ProfileOverlay:
+    # FPS, frame time and the slowest sections as p50/p95/p99 in ms. Text is
+    # re-rendered twice a second and the panel is blitted again whenever the
+    # game has drawn, since it may have drawn over it.
+    def __init__(self):
+        self.panel = None
+        self.next_refresh = 0
     
-    running = True
-    while running:
-        mouse_pos = pygame.mouse.get_pos()
-        
-        for event in pygame.event.get():
+    def draw(self, surface, drawn):
+        now = time.monotonic()
+        if self.panel is None or now >= self.next_refresh:
+            self.panel = self.render()
+            self.next_refresh = now + PROFILE_REFRESH / 1000.0
+            drawn = True
+        if drawn:
+            rect = surface.blit(self.panel, PROFILE_POS)
+            pygame.display.update(rect)
+        return drawn
+    
+    def render(self):
+        font = text_cache.font(20)
+        p50, p95, p99 = profiler.frames.percentiles(50, 95, 99)
+        lines = ["FPS %.0f   frame %.1f / %.1f / %.1f" % (profiler.fps(), p50, p95, p99)]
+        for name, p50, p95, p99 in profiler.summary(PROFILE_ROWS):
+            lines.append("%s  %.2f / %.2f / %.2f" % (name, p50, p95, p99))
+        if profiler.trace is not None:
+            lines.append("Recording trace: %d events (F4 to save)" % len(profiler.trace))
+        line_height = font.get_linesize()
+        panel = pygame.Surface((360, 8 + line_height * len(lines)))
+        panel.fill((30, 30, 30))
+        for i, line in enumerate(lines):
+            panel.blit(font.render(line, True, WHITE), (6, 4 + i * line_height))
+        return panel
+
+def toggle_profiler(game):
+    if profiler.enabled:
+        profiler.disable()
+        profiler.stop_trace()
+        game.full_redraw = True
+    else:
+        profiler.enable()
+
+def toggle_trace():
+    # Writing a long trace takes a while, so it happens off the main thread
+    if profiler.trace is None:
+        profiler.enable(trace=True)
+    else:
+        writer = threading.Thread(target=profiler.dump_trace, args=(TRACE_FILE, profiler.stop_trace()))
+        writer.start()
+
+def finish_trace():
+    events = profiler.stop_trace()
+    if events:
+        profiler.dump_trace(TRACE_FILE, events)
+
+class InputDispatcher:
+    # Turns one frame's events into game calls. Hover only needs where the
+    # pointer ended up, so the frame's motion events collapse into one
+    # hit-test after the loop; clicks and taps are handled in order at their
+    # own positions. Touches come in as FINGER* events in 0..1 coordinates.
+    # SDL also sends mouse events for them (flagged touch), which are
+    # dropped so a tap is only handled once. Only the first finger down is
+    # followed, and hover is cleared when it lifts.
+    def __init__(self, game, surface):
+        self.game = game
+        self.surface = surface
+        self.finger = None
+        self.motion = None
+        self.moved = False
+    
+    def finger_pos(self, event):
+        width, height = self.surface.get_size()
+        return (int(event.x * width), int(event.y * height))
+    
+    def hover(self, pos):
+        self.motion = pos
+        self.moved = True
+    
+    def dispatch(self, events):
+        # False once the window is closed
+        running = True
+        for event in events:
             if event.type == QUIT:
                 running = False
+            elif event.type in (MOUSEBUTTONDOWN, MOUSEMOTION) and getattr(event, "touch", False):
+                continue
             elif event.type == MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left click
-                    game.handle_click(event.pos)
+                    self.game.handle_click(event.pos)
             elif event.type == MOUSEMOTION:
-                if game.game_state in ["menu", "level_complete"]:
-                    for button in game.buttons:
-                        button.check_hover(mouse_pos)
-                elif game.game_state == "level_select":
-                    for button in game.level_buttons:
-                        button.check_hover(mouse_pos)
-                    game.prev_page_btn.check_hover(mouse_pos)
-                    game.next_page_btn.check_hover(mouse_pos)
-                    game.back_btn.check_hover(mouse_pos)
-        
-        game.draw(screen)
-        clock.tick(FPS)
+                self.hover(event.pos)
+            elif event.type == FINGERDOWN:
+                if self.finger is None:
+                    self.finger = event.finger_id
+                    pos = self.finger_pos(event)
+                    self.hover(pos)
+                    self.game.handle_click(pos)
+            elif event.type == FINGERMOTION:
+                if event.finger_id == self.finger:
+                    self.hover(self.finger_pos(event))
+            elif event.type == FINGERUP:
+                if event.finger_id == self.finger:
+                    self.finger = None
+                    self.hover(None)
+            elif event.type == KEYDOWN:
+                if event.key == K_F3:
+                    toggle_profiler(self.game)
+                elif event.key == K_F4:
+                    toggle_trace()
+        if self.moved:
+            self.game.update_hover(self.motion)
+            self.moved = False
+        return running
+
+def main():
+    game = Game()
+    overlay = ProfileOverlay()
+    dispatcher = InputDispatcher(game, screen)
+    if PROFILE or TRACE:
+        profiler.enable(trace=TRACE)
+    
+    running = True
+    idle_time = 0
+    dt = 0
+    while running:
+        profiler.frame()
+        with profiler.section("events"):
+            events = pygame.event.get()
+            running = dispatcher.dispatch(events)
+        
+        with profiler.section("update"):
+            busy = game.update(dt)
+        drawn = game.draw(screen)
+        if profiler.enabled:
+            drawn = overlay.draw(screen, drawn)
+        # The menu is up, now bring up audio without holding up the frame
+        sounds.start()
+        if drawn or events or busy:
+            idle_time = 0
+        # Drop to a low tick rate when nothing is happening to save battery
+        with profiler.section("tick"):
+            dt = clock.tick(FPS if idle_time < IDLE_DELAY else IDLE_FPS)
+        idle_time += dt
     
+    game.saver.close()
+    finish_trace()
     pygame.quit()
     sys.exit()
 